@@ -23,7 +23,23 @@
 ##################################################################################
 
 import sys
+from timeit import default_timer
+
+import numpy as np
 import pymel.core as pm
+from maya.api import OpenMaya as om
+
+import jlr_copy_deformer_weights_cache as cdw_cache
+import jlr_copy_deformer_weights_engine as engine
+import jlr_copy_deformer_weights_files as cdw_files
+import jlr_copy_deformer_weights_graph as cdw_graph
+import jlr_copy_deformer_weights_incremental as cdw_incremental
+import jlr_copy_deformer_weights_io as cdw_io
+import jlr_copy_deformer_weights_mirror as cdw_mirror
+import jlr_copy_deformer_weights_ops as cdw_ops
+import jlr_copy_deformer_weights_profile as cdw_profile
+import jlr_copy_deformer_weights_undo as cdw_undo
+from jlr_copy_deformer_weights_weightmap import WeightMap
 
 if sys.version_info.major == 2:
     from imp import reload
@@ -32,7 +48,10 @@ else:
 
 
 def transfer_deformer_weights(geo_source, geo_target=None, deformer_source=None, deformer_target=None,
-                              surface_association="closestPoint", interface=None):
+                              surface_association="closestPoint", interface=None, weight_io=None,
+                              source_indices=None, target_indices=None, use_component_selection=False,
+                              correspondence_file=None, stats=None, incremental=False, max_distance=None,
+                              strict_correspondence=False):
     """
     Copies the weight map of a deformer of an object to the deformer of another object.
     :param geo_source: Source Shape
@@ -41,104 +60,993 @@ def transfer_deformer_weights(geo_source, geo_target=None, deformer_source=None,
     :param deformer_target: Target Deformer
     :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
     :param interface: Copy of class CopyDeformerWeightsUI
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :param source_indices: Source vertex indices. Only the source triangles with all their vertices in this list
+    are used. By default all the triangles.
+    :param target_indices: Target point indices. Only these points are computed and written. By default all.
+    :param use_component_selection: Takes the source and target indices from the selected components of the
+    source and target geometries. The geometries without selected components use all their points.
+    :param correspondence_file: Path of a correspondence file. If it has the correspondence of geometries with the
+    same topology it is used instead of computing it, otherwise the correspondence is computed and saved into it.
+    :param stats: TransferStats filled with the phases and the counters of the transfer. By default a new one.
+    :param incremental: Remembers the transfer, and if the last transfer of the same maps and geometries is
+    remembered and the target weights did not change since then, only the target points that use a changed source
+    vertex are computed and written.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint. By default
+    there is no limit.
+    :param strict_correspondence: The correspondence file is also stale if the points of the geometries moved. By
+    default it is reused while the topology and the transfer parameters are the same.
+    :return: TransferStats, or None if it runs in the background of the interface or it fails.
     """
     assert geo_source and deformer_source and deformer_target, \
         "select a source and target geometry and then the source and target deformers"
 
-    previous_selection = pm.selected()
-
     if not geo_target:
         geo_target = geo_source
 
+    if use_component_selection:
+        source_indices = get_selected_points(geo_source) if source_indices is None else source_indices
+        target_indices = get_selected_points(geo_target) if target_indices is None else target_indices
+
     if interface:
         interface.progress_bar_init()
-        interface.progress_bar_next()
 
-    source_weight_list = get_weight_list(deformer_source, geo_source)
-    if not source_weight_list:
+    if weight_io is None:
+        weight_io = cdw_io.MayaWeightIO()
+
+    if not weight_io.has_weights(deformer_source, geo_source):
         pm.warning("The deformer {} does not have the weight list for {}".format(deformer_source, geo_source))
         if interface: interface.progress_bar_ends(message="Finished with errors!")
         return
 
-    target_weight_list = get_weight_list(deformer_target, geo_target)
-    if not target_weight_list:
+    if not weight_io.has_weights(deformer_target, geo_target):
         pm.warning("The deformer {} does not have the weight list for {}".format(deformer_target, geo_target))
         if interface: interface.progress_bar_ends(message="Finished with errors!")
         return
 
-    initialize_weight_list(target_weight_list, geo_target)
-
-    if interface: interface.progress_bar_next()
-    tmp_source = pm.duplicate(geo_source)[0]
-    tmp_target = pm.duplicate(geo_target)[0]
-    pm.rename(tmp_source, tmp_source.nodeName() + "_cdw_DUP")
-    pm.rename(tmp_target, tmp_target.nodeName() + "_cdw_DUP")
-    tmp_source.v.set(True)
-    tmp_target.v.set(True)
-
-    if interface: interface.progress_bar_next()
-    pm.select(clear=True)
-    l_jnt = list()
-    l_jnt.append(pm.joint(n="jnt_tmpA_01", p=[0, 0, 0]))
-    l_jnt.append(pm.joint(n="jnt_tmpA_02", p=[0, 1, 0]))
-    skin_source = pm.skinCluster(l_jnt, tmp_source, nw=1)
-    skin_target = pm.skinCluster(l_jnt, tmp_target, nw=1)
-
-    if interface: interface.progress_bar_next()
-    skin_source.setNormalizeWeights(0)
-    pm.skinPercent(skin_source, tmp_source, nrm=False, prw=100)
-    skin_source.setNormalizeWeights(True)
-    n_points = len(geo_source.getShape().getPoints())
-    if deformer_source.type() == "blendShape":
-        [skin_source.wl[i].w[0].set(source_weight_list.baseWeights[i].get()) for i in range(n_points)]
-        [skin_source.wl[i].w[1].set(1.0 - source_weight_list.baseWeights[i].get()) for i in range(n_points)]
-    else:
-        [skin_source.wl[i].w[0].set(source_weight_list.weights[i].get()) for i in range(n_points)]
-        [skin_source.wl[i].w[1].set(1.0 - source_weight_list.weights[i].get()) for i in range(n_points)]
-
-    if interface: interface.progress_bar_next()
-    pm.copySkinWeights(ss=skin_source, ds=skin_target, nm=True, sa=surface_association)
-
-    if interface: interface.progress_bar_next()
-    tmp_shape = skin_target.getGeometry()[0]
-    deformer_target_weights = [v for v in skin_target.getWeights(tmp_shape, 0)]
-    [target_weight_list.weights[i].set(val) for i, val in enumerate(deformer_target_weights)]
-
-    if interface: interface.progress_bar_next()
-    pm.delete([tmp_source, tmp_target, l_jnt])
-    pm.select(previous_selection)
+    if not has_source_triangles(geo_source, source_indices):
+        pm.warning("The selected vertices of {} do not cover any complete triangle".format(geo_source))
+        if interface: interface.progress_bar_ends(message="Finished with errors!")
+        return
+
+    stats = cdw_profile.TransferStats("transfer_deformer_weights") if stats is None else stats
+    stats.info.update(source=str(deformer_source), target=str(deformer_target),
+                      surface_association=surface_association, max_distance=max_distance)
+    cache = cdw_cache.SOURCE_CACHE
+
+    with stats.measure(weight_io, cache):
+        with stats.phase("read_source_weights"):
+            source_weight_map = get_source_weight_map(geo_source, deformer_source, weight_io)
+        if target_indices is not None:
+            target_indices = np.unique(np.asarray(target_indices, dtype=np.int32))
+
+        key = None
+        if correspondence_file:
+            key = get_correspondence_key(geo_source, geo_target, surface_association, source_indices, target_indices,
+                                         max_distance, strict_correspondence)
+
+        # The last transfer of the same maps is updated only if the geometries and the target weights did not change.
+        updated_points = None
+        if incremental:
+            session_key = ("incremental", str(deformer_source), geo_source.getShape().longName(),
+                           str(deformer_target), geo_target.getShape().longName())
+            # The remembered correspondence is only valid while the points of the geometries do not move.
+            session_fingerprint = tuple(sorted(get_correspondence_key(geo_source, geo_target, surface_association,
+                                                                      source_indices, target_indices, max_distance,
+                                                                      strict=True).items()))
+            session = cache.get(session_key, session_fingerprint)
+            if session is not None and session.is_valid(
+                    source_weight_map, weight_io.get_weights_version(deformer_target, geo_target)):
+                with stats.phase("incremental"):
+                    updated_points, values = session.update(source_weight_map)
+                try:
+                    with stats.phase("write"), cdw_undo.undo_step(weight_io):
+                        if len(updated_points):
+                            weight_io.write_weight_values(deformer_target, geo_target, updated_points, values)
+                except Exception:
+                    # The snapshot already has the new source weights, so it is not valid anymore.
+                    cache.invalidate(session_key)
+                    raise
+                session.target_version = weight_io.get_weights_version(deformer_target, geo_target)
+
+        correspondence = None
+        if correspondence_file and updated_points is None:
+            with stats.phase("load_correspondence"):
+                correspondence = cdw_files.load_correspondence(correspondence_file, key)
+
+        source_surface = target_points = target_normals = None
+        if correspondence is None and updated_points is None:
+            with stats.phase("prepare_surface"):
+                source_surface = prepare_surface(geo_source, source_indices=source_indices)
+            with stats.phase("read_target"):
+                target_points = get_points(geo_target.getShape())
+                target_normals = get_normals(geo_target.getShape()) if surface_association == "rayCast" else None
+                if target_indices is not None:
+                    target_points = target_points[target_indices]
+                    target_normals = target_normals[target_indices] if target_normals is not None else None
+
+    if updated_points is not None:
+        stats.count("source_vertices", len(source_weight_map))
+        stats.count("target_vertices", len(updated_points))
+        if interface: interface.progress_bar_ends(message="Finished successfully!")
+        return stats.finish()
+
+    def compute(progress):
+        result = correspondence
+        if result is None:
+            with stats.phase("correspondence"):
+                result = engine.compute_correspondence(source_surface, target_points, surface_association,
+                                                       target_normals=target_normals, max_distance=max_distance,
+                                                       progress=progress)
+            if correspondence_file:
+                with stats.phase("save_correspondence"):
+                    cdw_files.save_correspondence(correspondence_file, result, key)
+        with stats.phase("interpolate"):
+            return result, result.apply(source_weight_map)
+
+    def write(computed):
+        result, target_weight_map = computed
+        with stats.measure(weight_io, cache), stats.phase("write"), cdw_undo.undo_step(weight_io):
+            if target_indices is None:
+                weight_io.write_weight_map(deformer_target, geo_target, target_weight_map)
+            else:
+                weight_io.write_weight_values(deformer_target, geo_target, target_indices,
+                                              target_weight_map.to_dense())
+        if incremental:
+            cache.put(session_key,
+                      cdw_incremental.IncrementalTransfer(
+                          result, source_weight_map, target_indices,
+                          weight_io.get_weights_version(deformer_target, geo_target)),
+                      session_fingerprint)
+        stats.count("source_vertices", len(source_weight_map))
+        stats.count("target_vertices", len(target_weight_map))
+        if interface: interface.progress_bar_ends(message="Finished successfully!")
+        return stats.finish()
+
+    return run_task(interface, compute, write)
+
+
+# Callback ids of the live transfers by (source deformer, source geometry, target deformer, target geometry).
+_live_transfers = dict()
+
+
+def start_live_transfer(geo_source, geo_target, deformer_source, deformer_target, surface_association="closestPoint",
+                        weight_io=None, **kwargs):
+    """
+    Copies the weight map of a deformer to another deformer and copies it again every time the source weights
+    change, for example while they are painted. The copies are incremental, see transfer_deformer_weights, and run
+    when Maya is idle, so a stroke only updates the target points under the brush.
+    :param geo_source: Source geometry PyNode.
+    :param geo_target: Target geometry PyNode.
+    :param deformer_source: Source deformer PyNode, SkinInfluence or BlendShapeMap.
+    :param deformer_target: Target deformer PyNode or BlendShapeMap.
+    :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :param kwargs: Other arguments of transfer_deformer_weights.
+    :return: Key of the live transfer, see stop_live_transfer.
+    """
+    geo_target = geo_target or geo_source
+    assert str(deformer_source) != str(deformer_target) or geo_source != geo_target, \
+        "The source and the target of a live transfer must be different weight maps"
+    key = (str(deformer_source), str(geo_source), str(deformer_target), str(geo_target))
+    stop_live_transfer(key)
+    scheduled = list()
+
+    def run():
+        del scheduled[:]
+        if key not in _live_transfers:
+            return
+        try:
+            transfer_deformer_weights(geo_source, geo_target, deformer_source, deformer_target, surface_association,
+                                      weight_io=weight_io, incremental=True, **kwargs)
+        except Exception:
+            stop_live_transfer(key)
+            raise
+
+    def weights_changed(message, plug, other_plug, client_data):
+        if scheduled or not message & (om.MNodeMessage.kAttributeSet | om.MNodeMessage.kAttributeArrayAdded |
+                                       om.MNodeMessage.kAttributeArrayRemoved):
+            return
+        if om.MFnAttribute(plug.attribute()).name in cdw_io.WEIGHT_ATTRIBUTES:
+            scheduled.append(True)
+            pm.evalDeferred(run, lowestPriority=True)
+
+    source_node = getattr(deformer_source, "skin_cluster", getattr(deformer_source, "blend_shape", deformer_source))
+    _live_transfers[key] = om.MNodeMessage.addAttributeChangedCallback(cdw_io.get_mobject(source_node),
+                                                                       weights_changed)
+    run()
+    return key
+
+
+def stop_live_transfer(key=None):
+    """
+    Stops a live transfer, see start_live_transfer.
+    :param key: Key returned by start_live_transfer. By default all the live transfers are stopped.
+    """
+    for each_key in ([key] if key is not None else list(_live_transfers)):
+        if each_key in _live_transfers:
+            om.MMessage.removeCallback(_live_transfers.pop(each_key))
+
+
+def transfer_deformer_weights_batch(geo_source, deformer_source, targets, surface_association="closestPoint",
+                                    interface=None, weight_io=None, max_workers=None, stats=None,
+                                    max_distance=None):
+    """
+    Copies the weight map of a deformer of an object to the deformers of several objects.
+    The source is prepared once, the target weights are computed in parallel and then they are written one by one.
+    :param geo_source: Source Shape
+    :param deformer_source: Source Deformer
+    :param targets: list of tuples (target geometry, target deformer).
+    :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
+    :param interface: Copy of class CopyDeformerWeightsUI
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :param max_workers: Maximum number of threads used to compute the targets. By default the number of processors.
+    :param stats: TransferStats filled with the phases and the counters of the transfer. By default a new one.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint. By default
+    there is no limit.
+    :return: dict with the timing of each target and the throughput of the batch, or None if it runs in the
+    background of the interface.
+    """
+    assert geo_source and deformer_source and targets, "select a source geometry and deformer and the targets"
+
+    start = default_timer()
+    if weight_io is None:
+        weight_io = cdw_io.MayaWeightIO()
+
+    if interface:
+        interface.progress_bar_init()
+
+    if not weight_io.has_weights(deformer_source, geo_source):
+        pm.warning("The deformer {} does not have the weight list for {}".format(deformer_source, geo_source))
+        if interface: interface.progress_bar_ends(message="Finished with errors!")
+        return
+
+    valid_targets = list()
+    for geo_target, deformer_target in targets:
+        if weight_io.has_weights(deformer_target, geo_target):
+            valid_targets.append((geo_target, deformer_target))
+        else:
+            pm.warning("The deformer {} does not have the weight list for {}".format(deformer_target, geo_target))
+
+    stats = cdw_profile.TransferStats("transfer_deformer_weights_batch") if stats is None else stats
+    stats.info.update(source=str(deformer_source), targets=len(valid_targets),
+                      surface_association=surface_association, max_distance=max_distance)
+    cache = cdw_cache.SOURCE_CACHE
+
+    with stats.measure(weight_io, cache):
+        with stats.phase("prepare_source"):
+            source_surface, source_weight_map = prepare_source(geo_source, deformer_source, weight_io)
+        with stats.phase("read_target"):
+            targets_points = [get_points(geo_target.getShape()) for geo_target, _ in valid_targets]
+            targets_normals = None
+            if surface_association == "rayCast":
+                targets_normals = [get_normals(geo_target.getShape()) for geo_target, _ in valid_targets]
+
+    def compute(progress):
+        with stats.phase("compute"):
+            return engine.transfer_batch(source_surface, source_weight_map, targets_points,
+                                         surface_association=surface_association, max_workers=max_workers,
+                                         targets_normals=targets_normals, max_distance=max_distance,
+                                         progress=progress)
+
+    def write(results):
+        report = {"targets": list()}
+        with stats.measure(weight_io, cache), stats.phase("write"), cdw_undo.undo_step(weight_io):
+            for (geo_target, deformer_target), points, (target_weight_map, compute_time) in zip(valid_targets,
+                                                                                                 targets_points,
+                                                                                                 results):
+                write_start = default_timer()
+                weight_io.write_weight_map(deformer_target, geo_target, target_weight_map)
+                report["targets"].append({"geometry": str(geo_target),
+                                          "deformer": str(deformer_target),
+                                          "vertices": len(points),
+                                          "compute_seconds": compute_time,
+                                          "write_seconds": default_timer() - write_start,
+                                          })
+
+        report["seconds"] = default_timer() - start
+        report["vertices"] = sum(target["vertices"] for target in report["targets"])
+        report["vertices_per_second"] = report["vertices"] / report["seconds"] if report["seconds"] else 0.0
+        stats.count("source_vertices", len(source_weight_map))
+        stats.count("target_vertices", report["vertices"])
+        report["stats"] = stats.finish().to_dict()
+
+        for target in report["targets"]:
+            pm.displayInfo("{geometry} ({deformer}): {vertices} vertices, compute {compute_seconds:.3f}s, "
+                           "write {write_seconds:.3f}s".format(**target))
+        pm.displayInfo("Copied {} weight maps, {} vertices in {:.3f}s ({:.0f} vertices/s)".format(
+            len(report["targets"]), report["vertices"], report["seconds"], report["vertices_per_second"]))
+
+        if interface:
+            interface.progress_bar_ends(message="Finished successfully!" if len(valid_targets) == len(targets)
+                                        else "Finished with errors!")
+        return report
+
+    return run_task(interface, compute, write)
+
 
+def transfer_weight_maps(geo_source, geo_target, pairs, surface_association="closestPoint", interface=None,
+                         weight_io=None, source_indices=None, stats=None, max_distance=None):
+    """
+    Copies several weight maps of a source object to several weight maps of a target object.
+    The correspondence between the objects is computed once and the source maps are stacked in a matrix, so all the
+    target maps are computed with a single gather and each map only costs its reading and writing.
+    :param geo_source: Source Shape
+    :param geo_target: Target Shape
+    :param pairs: list of tuples (source deformer, target deformer). The deformers can be PyNodes, SkinInfluences or
+    BlendShapeMaps.
+    :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
+    :param interface: Copy of class CopyDeformerWeightsUI
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :param source_indices: Source vertex indices. Only the source triangles with all their vertices in this list
+    are used. By default all the triangles.
+    :param stats: TransferStats filled with the phases and the counters of the transfer. By default a new one.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint. By default
+    there is no limit.
+    :return: TransferStats, or None if it runs in the background of the interface.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    for deformer_source, deformer_target in pairs:
+        assert weight_io.has_weights(deformer_source, geo_source), \
+            "The deformer {} does not have the weight list for {}".format(deformer_source, geo_source)
+        assert weight_io.has_weights(deformer_target, geo_target), \
+            "The deformer {} does not have the weight list for {}".format(deformer_target, geo_target)
+    assert has_source_triangles(geo_source, source_indices), \
+        "The selected vertices of {} do not cover any complete triangle".format(geo_source)
+
+    if interface:
+        interface.progress_bar_init()
+
+    stats = cdw_profile.TransferStats("transfer_weight_maps") if stats is None else stats
+    stats.info.update(maps=len(pairs), surface_association=surface_association, max_distance=max_distance)
+    cache = cdw_cache.SOURCE_CACHE
+
+    with stats.measure(weight_io, cache):
+        with stats.phase("prepare_surface"):
+            surface = prepare_surface(geo_source, source_indices=source_indices)
+        with stats.phase("read_source_weights"):
+            source_weights = np.stack([get_source_weight_map(geo_source, deformer_source, weight_io).to_dense()
+                                       for deformer_source, _ in pairs]) if pairs else None
+        with stats.phase("read_target"):
+            target_points = get_points(geo_target.getShape())
+            target_normals = get_normals(geo_target.getShape()) if surface_association == "rayCast" else None
+
+    def compute(progress):
+        if not pairs:
+            return list()
+        with stats.phase("correspondence"):
+            correspondence = engine.compute_correspondence(surface, target_points, surface_association,
+                                                           target_normals=target_normals, max_distance=max_distance,
+                                                           progress=progress)
+        with stats.phase("interpolate"):
+            return correspondence.apply(source_weights)
+
+    def write(target_weights):
+        with stats.measure(weight_io, cache), stats.phase("write"), cdw_undo.undo_step(weight_io):
+            for (_, deformer_target), weights in zip(pairs, target_weights):
+                weight_io.write_weight_map(deformer_target, geo_target, WeightMap.from_dense(weights))
+        stats.count("target_vertices", len(target_points) * len(pairs))
+        if interface: interface.progress_bar_ends(message="Finished successfully!")
+        return stats.finish()
+
+    return run_task(interface, compute, write)
+
+
+def transfer_skin_influences(geo_source, skin_cluster, geo_target, pairs, surface_association="closestPoint",
+                             weight_io=None, source_indices=None, max_distance=None):
+    """
+    Copies the weights of several influences of a skinCluster to several deformers of a target object.
+    The weight matrix of the skinCluster is read once and the correspondence between the objects is computed once,
+    so each influence only costs a gather of its column.
+    :param geo_source: Source Shape
+    :param skin_cluster: skinCluster of the source object.
+    :param geo_target: Target Shape
+    :param pairs: list of tuples (influence, target deformer).
+    :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :param source_indices: Source vertex indices. Only the source triangles with all their vertices in this list
+    are used. By default all the triangles.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint. By default
+    there is no limit.
+    :return: TransferStats
+    """
+    pairs = [(cdw_io.SkinInfluence(skin_cluster, influence), deformer_target) for influence, deformer_target in pairs]
+    return transfer_weight_maps(geo_source, geo_target, pairs, surface_association, weight_io=weight_io,
+                                source_indices=source_indices, max_distance=max_distance)
+
+
+def transfer_blend_shape_maps(geo_source, blend_shape_source, geo_target=None, blend_shape_target=None,
+                              surface_association="closestPoint", interface=None, weight_io=None,
+                              source_indices=None, max_distance=None):
+    """
+    Copies the base weights and the target weights of a blendShape to another blendShape. The maps are matched by
+    name, the targets of the source blendShape that are not in the target blendShape are skipped.
+    :param geo_source: Source Shape
+    :param blend_shape_source: Source blendShape
+    :param geo_target: Target Shape. By default the source shape.
+    :param blend_shape_target: Target blendShape
+    :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
+    :param interface: Copy of class CopyDeformerWeightsUI
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :param source_indices: Source vertex indices. Only the source triangles with all their vertices in this list
+    are used. By default all the triangles.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint. By default
+    there is no limit.
+    :return: TransferStats, or None if it runs in the background of the interface.
+    """
+    assert geo_source and blend_shape_source and blend_shape_target, \
+        "select a source and target geometry and then the source and target blendShapes"
+
+    geo_target = geo_source if not geo_target else geo_target
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+
+    target_maps = dict((blend_shape_map.name, blend_shape_map)
+                       for blend_shape_map in weight_io.list_blend_shape_maps(blend_shape_target))
+    pairs = list()
+    for source_map in weight_io.list_blend_shape_maps(blend_shape_source):
+        if source_map.name in target_maps:
+            pairs.append((source_map, target_maps[source_map.name]))
+        else:
+            pm.warning("{} does not have the target {}".format(blend_shape_target, source_map.name))
+
+    return transfer_weight_maps(geo_source, geo_target, pairs, surface_association, interface, weight_io,
+                                source_indices, max_distance=max_distance)
+
+
+def export_deformer_weights(path, maps, weight_io=None):
+    """
+    Writes the weight maps of some deformers into a file, with the world space points and the triangles of their
+    geometries so they can be transferred in other scenes with import_deformer_weights. The geometries are stored
+    with the shortest unique path of their shapes, which is the name of the shape if it is unique in the scene.
+    :param path: File path.
+    :param maps: list of tuples (deformer, geometry). The deformers can be PyNodes, SkinInfluences or BlendShapeMaps.
+    :param weight_io: WeightIO used to read the weights. By default the weights of the Maya scene.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    geometries = dict()
+    shapes = dict()
+    weight_maps = list()
+    for deformer, geo in maps:
+        assert weight_io.has_weights(deformer, geo), \
+            "The deformer {} does not have the weight list for {}".format(deformer, geo)
+        shape = geo.getShape()
+        # The shortest unique path is the node name, unless other shapes of the scene have the same name.
+        geometry_name = str(shape.shortName())
+        assert shapes.setdefault(geometry_name, shape.longName()) == shape.longName(), \
+            "The shapes {} and {} have the same name {}".format(shapes[geometry_name], shape.longName(), geometry_name)
+        if geometry_name not in geometries:
+            geometries[geometry_name] = (get_points(shape), get_triangles(shape))
+        weight_maps.append((str(deformer), geometry_name, weight_io.read_weight_map(deformer, geo)))
+
+    cdw_files.write_weight_archive(path, geometries, weight_maps)
+
+
+def import_deformer_weights(path, geo_target, pairs, geometry=None, surface_association="closestPoint",
+                            interface=None, weight_io=None, cache=None, max_distance=None):
+    """
+    Transfers weight maps stored with export_deformer_weights to the deformers of a target object. The maps are
+    interpolated from the stored geometry, so the source geometry is not needed and the target can have another
+    topology.
+    :param path: File path.
+    :param geo_target: Target Shape
+    :param pairs: list of tuples (stored map name, target deformer). The maps must belong to the same geometry.
+    :param geometry: Name of the stored geometry of the maps. It can be omitted if the names of the maps are unique.
+    :param surface_association: Surface Association. Valid values: closestPoint, rayCast, or closestComponent.
+    :param interface: Copy of class CopyDeformerWeightsUI
+    :param weight_io: WeightIO used to write the weights. By default the weights of the Maya scene.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint. By default
+    there is no limit.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    archive = cdw_files.WeightArchive(path)
+
+    descriptions = [archive.get_map_description(name, geometry) for name, _ in pairs]
+    geometries = set(description["geometry"] for description in descriptions)
+    assert len(geometries) <= 1, "The maps belong to several geometries: {}".format(", ".join(sorted(geometries)))
+    for _, deformer_target in pairs:
+        assert weight_io.has_weights(deformer_target, geo_target), \
+            "The deformer {} does not have the weight list for {}".format(deformer_target, geo_target)
+    if not pairs:
+        return
+
+    if interface:
+        interface.progress_bar_init()
+
+    geometry = descriptions[0]["geometry"]
+    points, triangles = archive.get_geometry(geometry)
+    surface = cache.get_or_create(("archive", path, geometry), cdw_cache.array_fingerprint(points, triangles),
+                                  lambda: engine.SourceSurface(points, triangles))
+    source_weights = np.stack([archive.get_weight_map(name, geometry).to_dense() for name, _ in pairs])
+    target_points = get_points(geo_target.getShape())
+    target_normals = get_normals(geo_target.getShape()) if surface_association == "rayCast" else None
+
+    def compute(progress):
+        correspondence = engine.compute_correspondence(surface, target_points, surface_association,
+                                                       target_normals=target_normals, max_distance=max_distance,
+                                                       progress=progress)
+        return correspondence.apply(source_weights)
+
+    def write(target_weights):
+        with cdw_undo.undo_step(weight_io):
+            for (_, deformer_target), weights in zip(pairs, target_weights):
+                weight_io.write_weight_map(deformer_target, geo_target, WeightMap.from_dense(weights))
+        if interface: interface.progress_bar_ends(message="Finished successfully!")
+
+    run_task(interface, compute, write)
+
+
+def run_task(interface, task, on_finished):
+    """
+    Runs the part of a transfer that does not use the scene. With an interface the task runs in a worker thread, so
+    the UI keeps responding and shows its progress, and on_finished is called in the main thread when it ends.
+    Without an interface both are called now.
+    :param interface: Copy of class CopyDeformerWeightsUI or None.
+    :param task: Function that receives a progress function, see engine.compute_correspondence, and returns a result.
+    :param on_finished: Function that receives the result of the task. It can read and write the scene.
+    :return: The value returned by on_finished, or None if the task runs in the background.
+    """
     if interface:
-        interface.progress_bar_next()
-        interface.progress_bar_ends(message="Finished successfully!")
+        interface.run_in_background(task, on_finished)
+        return None
+    return on_finished(task(None))
+
+
+def prepare_source(geo_source, deformer_source, weight_io, cache=None, source_indices=None):
+    """
+    Returns the prepared data of a source: its SourceSurface and its weight map.
+    Both are reused from the cache while the points, the topology and the weights of the source do not change.
+    :param geo_source: Source geometry PyNode.
+    :param deformer_source: Source deformer PyNode or SkinInfluence.
+    :param weight_io: WeightIO used to read the weights.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :param source_indices: Vertex indices. Only the triangles with all their vertices in this list are used.
+    :return: tuple with the SourceSurface and the WeightMap.
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    return (prepare_surface(geo_source, cache, source_indices),
+            get_source_weight_map(geo_source, deformer_source, weight_io, cache))
+
+
+def get_source_weight_map(geo_source, deformer_source, weight_io, cache=None):
+    """
+    Returns the weight map of a source. It is reused from the cache while the weights of the source do not change.
+    :param geo_source: Source geometry PyNode.
+    :param deformer_source: Source deformer PyNode, SkinInfluence or BlendShapeMap.
+    :param weight_io: WeightIO used to read the weights.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: WeightMap
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    if isinstance(deformer_source, cdw_io.SkinInfluence):
+        matrix, influences = get_skin_weights(geo_source, deformer_source.skin_cluster, weight_io, cache)
+        return WeightMap.from_dense(matrix[:, deformer_source.get_column(influences)])
+
+    version = weight_io.get_weights_version(deformer_source, geo_source)
+    if version is None:
+        return weight_io.read_weight_map(deformer_source, geo_source)
+
+    return cache.get_or_create(("weights", str(deformer_source), geo_source.getShape().longName()), version,
+                               lambda: weight_io.read_weight_map(deformer_source, geo_source))
+
+
+def prepare_surface(geo_source, cache=None, source_indices=None):
+    """
+    Returns the SourceSurface of a source object. It is reused from the cache while the points and the topology of
+    the object do not change.
+    :param geo_source: Source geometry PyNode.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :param source_indices: Vertex indices. Only the triangles with all their vertices in this list are used.
+    :return: SourceSurface
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    shape = geo_source.getShape()
+    shape_name = shape.longName()
+
+    points = get_points(shape)
+    fingerprint = get_fingerprint(shape, points)
+    if source_indices is None:
+        return cache.get_or_create(("surface", shape_name), fingerprint,
+                                   lambda: engine.SourceSurface(points, get_triangles(shape)))
+
+    source_indices = np.unique(np.asarray(source_indices, dtype=np.int32))
+    return cache.get_or_create(
+        ("surface", shape_name, cdw_cache.array_fingerprint(source_indices)), fingerprint,
+        lambda: engine.SourceSurface(points, engine.subset_triangles(get_triangles(shape), source_indices)))
+
+
+def has_source_triangles(geo_source, source_indices=None):
+    """
+    Returns True if some triangles of a source object have all their vertices in a list of vertex indices, so a
+    SourceSurface can be built with them.
+    :param geo_source: Source geometry PyNode.
+    :param source_indices: Vertex indices, or None for all the vertices.
+    :return: bool
+    """
+    if source_indices is None:
+        return True
+    source_indices = np.unique(np.asarray(source_indices, dtype=np.int32))
+    return len(engine.subset_triangles(get_triangles(geo_source.getShape()), source_indices)) > 0
+
+
+def get_skin_weights(geo, skin_cluster, weight_io, cache=None):
+    """
+    Returns the weight matrix of a skinCluster. It is read with a single call and reused from the cache while the
+    weights of the skinCluster do not change.
+    :param geo: Geometry PyNode.
+    :param skin_cluster: skinCluster PyNode or name.
+    :param weight_io: WeightIO used to read the weights.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: tuple with an (n_points, n_influences) float32 array and the list of influence names.
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    version = weight_io.get_weights_version(skin_cluster, geo)
+    if version is None:
+        return weight_io.read_skin_weights(skin_cluster, geo)
+    return cache.get_or_create(("skin", str(skin_cluster), geo.getShape().longName()), version,
+                               lambda: weight_io.read_skin_weights(skin_cluster, geo))
+
+
+def mirror_deformer_weights(geo, deformer, axis="x", direction=1, tolerance=0.001, weight_io=None):
+    """
+    Mirrors the weight map of a deformer in the object space of a geometry.
+    :param geo: Geometry PyNode.
+    :param deformer: Deformer PyNode.
+    :param axis: Mirror axis: x, y or z.
+    :param direction: 1 copies the positive side into the negative side, -1 the negative side into the positive side.
+    :param tolerance: Maximum distance between a mirrored position and a vertex to use that vertex.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    points = get_points(geo.getShape(), space=om.MSpace.kObject)
+    correspondence = get_mirror_correspondence(geo.getShape(), axis, tolerance, points)
+
+    weight_map = weight_io.read_weight_map(deformer, geo)
+    weights = cdw_mirror.mirror_weights(weight_map.to_dense(), correspondence,
+                                        cdw_mirror.get_receiving_points(points, axis, direction))
+    with cdw_undo.undo_step(weight_io):
+        weight_io.write_weight_map(deformer, geo, WeightMap.from_dense(weights, default=weight_map.default))
+
+
+def flip_deformer_weights(geo, deformer, axis="x", tolerance=0.001, weight_io=None):
+    """
+    Flips the weight map of a deformer in the object space of a geometry.
+    :param geo: Geometry PyNode.
+    :param deformer: Deformer PyNode.
+    :param axis: Mirror axis: x, y or z.
+    :param tolerance: Maximum distance between a mirrored position and a vertex to use that vertex.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    points = get_points(geo.getShape(), space=om.MSpace.kObject)
+    correspondence = get_mirror_correspondence(geo.getShape(), axis, tolerance, points)
+
+    weight_map = weight_io.read_weight_map(deformer, geo)
+    weights = cdw_mirror.flip_weights(weight_map.to_dense(), correspondence)
+    with cdw_undo.undo_step(weight_io):
+        weight_io.write_weight_map(deformer, geo, WeightMap.from_dense(weights, default=weight_map.default))
+
+
+def get_mirror_correspondence(shape, axis, tolerance, points=None, cache=None):
+    """
+    Returns the symmetry correspondence of a shape. It is computed once and reused from the cache while the points
+    and the topology of the shape do not change.
+    :param shape: Shape PyNode.
+    :param axis: Mirror axis: x, y or z.
+    :param tolerance: Maximum distance between a mirrored position and a vertex to use that vertex.
+    :param points: Object space points of the shape, if they were already read.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: Correspondence
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    points = get_points(shape, space=om.MSpace.kObject) if points is None else points
+    triangles = get_triangles(shape) if shape.type() == "mesh" else np.zeros((0, 3), dtype=np.int64)
+    return cache.get_or_create(("mirror", shape.longName(), axis, tolerance), get_fingerprint(shape, points),
+                               lambda: cdw_mirror.mirror_correspondence(points, triangles, axis, tolerance))
+
+
+def edit_deformer_weights(geo, deformers, function, points=None, weight_io=None):
+    """
+    Applies an operation to the weight maps of some deformers of a geometry. The maps are read once, the operation
+    runs on all of them at the same time and they are written back as one undo step.
+    :param geo: Geometry PyNode.
+    :param deformers: Deformer PyNode, BlendShapeMap, or a list of them.
+    :param function: Function that receives an (n_maps, n_points) float32 array with the weights and returns the
+    new weights with the same shape.
+    :param points: Point indices. Only these points are written. By default all.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    :return: (n_maps, n_points) float32 array with the new weights.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    deformers = list(deformers) if isinstance(deformers, (list, tuple)) else [deformers]
+    weight_maps = [weight_io.read_weight_map(deformer, geo) for deformer in deformers]
+    weights = function(np.stack([weight_map.to_dense() for weight_map in weight_maps]))
+
+    with cdw_undo.undo_step(weight_io):
+        for deformer, weight_map, new_weights in zip(deformers, weight_maps, weights):
+            if points is None:
+                weight_io.write_weight_map(deformer, geo, WeightMap.from_dense(new_weights, default=weight_map.default))
+            else:
+                weight_io.write_weight_values(deformer, geo, points, new_weights[points])
+    return weights
+
+
+def smooth_deformer_weights(geo, deformers, iterations=1, strength=0.5, use_component_selection=False,
+                            weight_io=None):
+    """
+    Smooths the weight maps of some deformers moving each weight to the mean of its neighbor vertices.
+    :param geo: Geometry PyNode.
+    :param deformers: Deformer PyNode, BlendShapeMap, or a list of them.
+    :param iterations: Number of smoothing steps.
+    :param strength: Fraction of the way to the mean of the neighbors moved on each step, from 0 to 1.
+    :param use_component_selection: Only the selected points of the geometry are smoothed.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    points = get_selected_points(geo) if use_component_selection else None
+    adjacency = get_adjacency(geo.getShape())
+
+    def function(weights):
+        return cdw_ops.smooth(weights, adjacency, iterations, strength, points)
+
+    edit_deformer_weights(geo, deformers, function, points, weight_io)
+
+
+def combine_deformer_weights(geo, deformers, other_deformer, operation="multiply", factor=1.0,
+                             use_component_selection=False, weight_io=None):
+    """
+    Combines the weight maps of some deformers with the weight map of another deformer, for example to multiply
+    them by a mask.
+    :param geo: Geometry PyNode.
+    :param deformers: Deformer PyNode, BlendShapeMap, or a list of them.
+    :param other_deformer: Deformer PyNode, SkinInfluence or BlendShapeMap with the other weight map.
+    :param operation: add, subtract, multiply, min, max or blend, see jlr_copy_deformer_weights_ops.combine.
+    :param factor: Amount of the result of the operation, from 0 (the weights do not change) to 1.
+    :param use_component_selection: Only the selected points of the geometry change.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    weight_io = cdw_io.MayaWeightIO() if weight_io is None else weight_io
+    other = weight_io.read_weight_map(other_deformer, geo).to_dense()
+    points = get_selected_points(geo) if use_component_selection else None
+    edit_deformer_weights(geo, deformers, lambda weights: cdw_ops.combine(weights, other, operation, factor),
+                          points, weight_io)
+
+
+def clamp_deformer_weights(geo, deformers, minimum=0.0, maximum=1.0, use_component_selection=False,
+                           weight_io=None):
+    """
+    Limits the weight maps of some deformers to a range.
+    :param geo: Geometry PyNode.
+    :param deformers: Deformer PyNode, BlendShapeMap, or a list of them.
+    :param minimum: Minimum weight.
+    :param maximum: Maximum weight.
+    :param use_component_selection: Only the selected points of the geometry change.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    points = get_selected_points(geo) if use_component_selection else None
+    edit_deformer_weights(geo, deformers, lambda weights: cdw_ops.clamp(weights, minimum, maximum), points,
+                          weight_io)
+
+
+def normalize_deformer_weights(geo, deformers, minimum=0.0, maximum=1.0, weight_io=None):
+    """
+    Rescales the weight map of each deformer so its lowest weight is minimum and its highest weight is maximum.
+    :param geo: Geometry PyNode.
+    :param deformers: Deformer PyNode, BlendShapeMap, or a list of them.
+    :param minimum: New lowest weight.
+    :param maximum: New highest weight.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    edit_deformer_weights(geo, deformers, lambda weights: cdw_ops.normalize(weights, minimum, maximum),
+                          weight_io=weight_io)
+
+
+def remap_deformer_weights(geo, deformers, curve, interpolation="linear", use_component_selection=False,
+                           weight_io=None):
+    """
+    Remaps the weight maps of some deformers with a curve, for example to change their falloff.
+    :param geo: Geometry PyNode.
+    :param deformers: Deformer PyNode, BlendShapeMap, or a list of them.
+    :param curve: list of (input, output) keys sorted by input, see jlr_copy_deformer_weights_ops.remap.
+    :param interpolation: linear, or smooth for an ease in and out between the keys.
+    :param use_component_selection: Only the selected points of the geometry change.
+    :param weight_io: WeightIO used to read and write the weights. By default the weights of the Maya scene.
+    """
+    points = get_selected_points(geo) if use_component_selection else None
+    edit_deformer_weights(geo, deformers, lambda weights: cdw_ops.remap(weights, curve, interpolation), points,
+                          weight_io)
+
+
+def get_adjacency(shape, cache=None):
+    """
+    Returns the vertex adjacency of a shape. It is built once and reused from the cache while the topology of the
+    shape does not change. The shapes that are not meshes do not have neighbors.
+    :param shape: Shape PyNode.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: VertexAdjacency
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    n_points = cdw_io.MayaWeightIO.get_point_count(shape)
+    topology = get_topology(shape)
+    # Same fingerprint as get_topology_fingerprint, without reading the topology twice.
+    fingerprint = cdw_cache.array_fingerprint(np.array([n_points]), *topology)
+    if not topology:
+        topology = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    return cache.get_or_create(("adjacency", shape.longName()), fingerprint,
+                               lambda: cdw_ops.VertexAdjacency.from_polygons(n_points, *topology))
+
+
+def get_selected_points(geo):
+    """
+    Returns the indices of the selected points of a geometry. Selected faces and edges are converted to vertices.
+    :param geo: Geometry PyNode.
+    :return: sorted int32 numpy array, or None if the geometry does not have selected components.
+    """
+    shape_path = cdw_io.get_dag_path(geo.getShape())
+    selection = pm.selected(flatten=False)
+    components = [str(item) for item in selection if isinstance(item, pm.Component)]
+    if not components:
+        return None
+
+    points = pm.polyListComponentConversion(components, toVertex=True) if geo.getShape().type() == "mesh" \
+        else components
+    selection_list = om.MSelectionList()
+    for component in points:
+        selection_list.add(str(component))
+
+    indices = list()
+    for i in range(selection_list.length()):
+        dag_path, component = selection_list.getComponent(i)
+        if dag_path != shape_path or component.isNull():
+            continue
+        if component.hasFn(om.MFn.kSingleIndexedComponent):
+            indices.extend(om.MFnSingleIndexedComponent(component).getElements())
+        else:
+            it_geometry = om.MItGeometry(dag_path, component)
+            while not it_geometry.isDone():
+                indices.append(it_geometry.index())
+                it_geometry.next()
+    if not indices:
+        return None
+    return np.unique(np.array(indices, dtype=np.int32))
+
+
+def get_fingerprint(shape, points):
+    """
+    Returns a fingerprint of the points and the topology of a shape.
+    :param shape: Shape PyNode.
+    :param points: (n, 3) array with the points of the shape.
+    :return: str
+    """
+    return cdw_cache.array_fingerprint(points, *get_topology(shape))
+
+
+def get_topology_fingerprint(shape):
+    """
+    Returns a fingerprint of the topology of a shape. It does not change when the points are moved.
+    :param shape: Shape PyNode.
+    :return: str
+    """
+    return cdw_cache.array_fingerprint(np.array([cdw_io.MayaWeightIO.get_point_count(shape)]), *get_topology(shape))
+
+
+def get_topology(shape):
+    """
+    Returns the face vertex counts and the face vertex indices of a mesh. Other shapes do not have topology.
+    :param shape: Shape PyNode.
+    :return: tuple of arrays.
+    """
+    if shape.type() != "mesh":
+        return tuple()
+    face_counts, face_vertices = om.MFnMesh(cdw_io.get_dag_path(shape)).getVertices()
+    return np.array(face_counts), np.array(face_vertices)
+
+
+def get_correspondence_key(geo_source, geo_target, surface_association, source_indices=None, target_indices=None,
+                           max_distance=None, strict=False):
+    """
+    Returns the key of a correspondence file: the fingerprints of the topology of both geometries and the parameters
+    of the transfer. A correspondence file with another key is stale, so it is reused when a geometry is republished
+    with the same topology.
+    :param geo_source: Source geometry PyNode.
+    :param geo_target: Target geometry PyNode.
+    :param surface_association: Surface Association.
+    :param source_indices: Source vertex indices or None.
+    :param target_indices: Target point indices or None.
+    :param max_distance: Maximum distance of the rayCast hits or None.
+    :param strict: Adds the fingerprints of the points of both geometries, so the key changes if a point moves.
+    :return: dict
+    """
+    source_shape = geo_source.getShape()
+    target_shape = geo_target.getShape()
+    key = {"source_topology": get_topology_fingerprint(source_shape),
+           "target_topology": get_topology_fingerprint(target_shape),
+           "surface_association": surface_association,
+           "max_distance": max_distance,
+           "source_indices": None,
+           "target_indices": None,
+           }
+    if source_indices is not None:
+        key["source_indices"] = cdw_cache.array_fingerprint(np.unique(np.asarray(source_indices, dtype=np.int32)))
+    if target_indices is not None:
+        key["target_indices"] = cdw_cache.array_fingerprint(np.unique(np.asarray(target_indices, dtype=np.int32)))
+    if strict:
+        key["source_points"] = cdw_cache.array_fingerprint(get_points(source_shape))
+        key["target_points"] = cdw_cache.array_fingerprint(get_points(target_shape))
+    return key
+
+
+def get_points(shape, space=om.MSpace.kWorld):
+    """
+    Returns the positions of the points of a shape.
+    :param shape: PyNode of a deformable shape.
+    :param space: OpenMaya space of the positions. By default world space.
+    :return: (n, 3) numpy array.
+    """
+    it_geometry = om.MItGeometry(cdw_io.get_dag_path(shape))
+    return np.array(it_geometry.allPositions(space), dtype=np.float64).reshape(-1, 4)[:, :3]
+
+
+def get_normals(shape):
+    """
+    Returns the world space normals of the vertices of a mesh.
+    :param shape: PyNode of a deformable shape.
+    :return: (n, 3) numpy array, or None if the shape is not a mesh.
+    """
+    if shape.type() != "mesh":
+        return None
+    normals = om.MFnMesh(cdw_io.get_dag_path(shape)).getVertexNormals(False, om.MSpace.kWorld)
+    return np.array(normals, dtype=np.float64).reshape(-1, 3)
+
+
+def get_triangles(shape):
+    """
+    Returns the vertex indices of the triangles of a mesh.
+    :param shape: PyNode of a mesh shape.
+    :return: (n, 3) numpy array.
+    """
+    _, vertices = om.MFnMesh(cdw_io.get_dag_path(shape)).getTriangles()
+    return np.array(vertices, dtype=np.int64).reshape(-1, 3)
+
+
+def read_weights(deformer, geometry):
+    """
+    Returns the weights of every point of a geometry for a deformer with a single getAttr call.
+    :param deformer: Deformer PyNode.
+    :param geometry: Geometry PyNode.
+    :return: (n_points,) float32 numpy array.
+    """
+    return cdw_io.MayaWeightIO().read_weights(deformer, geometry)
+
+
+def write_weights(deformer, geometry, weights):
+    """
+    Sets the weight map of a deformer for a geometry with a single setAttr call.
+    :param deformer: Deformer PyNode.
+    :param geometry: Geometry PyNode.
+    :param weights: (n_points,) array.
+    """
+    cdw_io.MayaWeightIO().write_weights(deformer, geometry, weights)
 
 
 def get_weight_list(in_deformer, in_mesh):
+    index = cdw_graph.get_index()
     for shape in in_mesh.getShapes():
-        n_points = len(shape.getPoints())
-        for index, each_input in enumerate(in_deformer.input):
-            l_connections = each_input.inputGeometry.listConnections(s=1, d=0)
-            if l_connections:
-                l_history = l_connections[0].listHistory(f=1)
-                l_mesh = list(filter(lambda x: type(x) == type(shape), l_history))
-                l_mesh = [str(mesh.nodeName()) for mesh in l_mesh]
-                if str(shape.nodeName()) in l_mesh:
-
-                    if in_deformer.type() == "blendShape":
-                        weight_list = in_deformer.inputTarget[0].baseWeights
-                        return weight_list
-
-                    if not in_deformer.weightList[index]:
-                        initialize_weight_list(in_deformer.weightList[index], in_mesh)
-                    weight_list = in_deformer.weightList[index]
-                    wgt_indexes = map(lambda _: _.index(), weight_list.weights)
-                    [weight_list.weights[index].set(0) for index in range(n_points) if index not in wgt_indexes]
-                    return weight_list
+        geometry_index = index.get_geometry_index(in_deformer, shape)
+        if geometry_index is None:
+            continue
+
+        if in_deformer.type() == "blendShape":
+            weight_list = in_deformer.inputTarget[geometry_index].baseWeights
+            return weight_list
+
+        # The points that are not stored have the default weight 1.0, so the weight list is not filled.
+        return in_deformer.weightList[geometry_index]
 
 
 def initialize_weight_list(weight_list, in_mesh):
-    n_points = len(in_mesh.getShape().getPoints())
-    [weight_list.weights[i_point].set(1) for i_point in range(n_points)]
+    n_points = cdw_io.MayaWeightIO.get_point_count(in_mesh)
+    cdw_io.MayaWeightIO.set_plug_values(str(weight_list.weights), np.arange(n_points), np.ones(n_points))
 
 
 def open_copy_deformer_weights():
@@ -149,6 +1057,8 @@ def open_copy_deformer_weights():
     reload(cdwUI)
     ui = cdwUI.CopyDeformerWeightsUI()
     ui.transfer_function = transfer_deformer_weights
+    ui.batch_transfer_function = transfer_deformer_weights_batch
+    ui.maps_transfer_function = transfer_blend_shape_maps
     ui.show()
 
 
@@ -13,12 +13,19 @@
 # Author: Juan Lara.
 ##################################################################################
 
+import threading
+import traceback
+
 from PySide2 import QtCore, QtWidgets
 from shiboken2 import wrapInstance
 from maya import OpenMayaUI
 
 import pymel.core as pm
 
+import jlr_copy_deformer_weights_engine as engine
+import jlr_copy_deformer_weights_graph as cdw_graph
+from jlr_copy_deformer_weights_io import BlendShapeMap, MayaWeightIO, SkinInfluence
+
 
 class CopyDeformerWeightsUI(object):
     """
@@ -27,6 +34,8 @@ class CopyDeformerWeightsUI(object):
 
     def __init__(self):
         self.transfer_function = None
+        self.batch_transfer_function = None
+        self.maps_transfer_function = None
 
         """
         Create the CopyDeformerWeights UI
@@ -105,17 +114,43 @@ class CopyDeformerWeightsUI(object):
 
         self.object_target_list = QtWidgets.QListWidget(self.target_group_box)
         self.object_target_list.setObjectName("object_target_list")
+        self.object_target_list.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.object_target_list.currentItemChanged.connect(lambda: self.update_target_deformer_list())
         self.target_list_layout.addWidget(self.object_target_list)
 
-        self.deformer_target_list = QtWidgets.QListWidget(self.target_group_box)
-        self.deformer_target_list.setObjectName("deformer_target_list")
-        self.target_list_layout.addWidget(self.deformer_target_list)
+        self.deformer_target_tree = QtWidgets.QTreeWidget(self.target_group_box)
+        self.deformer_target_tree.setObjectName("deformer_target_tree")
+        self.deformer_target_tree.setHeaderHidden(True)
+        self.target_list_layout.addWidget(self.deformer_target_tree)
 
         self.target_layout.addLayout(self.target_list_layout)
+
+        self.batch_check_box = QtWidgets.QCheckBox(self.target_group_box)
+        self.batch_check_box.setObjectName("batch_check_box")
+        self.batch_check_box.setText("Copy to all the selected targets")
+        self.target_layout.addWidget(self.batch_check_box)
         self.target_gb_layout.addLayout(self.target_layout, 0, 0, 1, 1)
         self.main_layout.addWidget(self.target_group_box)
 
+        self.association_layout = QtWidgets.QHBoxLayout()
+        self.association_layout.setObjectName("association_layout")
+
+        self.association_label = QtWidgets.QLabel(self.dialog)
+        self.association_label.setObjectName("association_label")
+        self.association_label.setText("Surface Association")
+        self.association_layout.addWidget(self.association_label)
+
+        self.association_combo_box = QtWidgets.QComboBox(self.dialog)
+        self.association_combo_box.setObjectName("association_combo_box")
+        self.association_combo_box.addItems(["closestPoint", "rayCast", "closestComponent"])
+        self.association_layout.addWidget(self.association_combo_box)
+        self.main_layout.addLayout(self.association_layout)
+
+        self.components_check_box = QtWidgets.QCheckBox(self.dialog)
+        self.components_check_box.setObjectName("components_check_box")
+        self.components_check_box.setText("Only the selected components")
+        self.main_layout.addWidget(self.components_check_box)
+
         self.progress_bar_layout = QtWidgets.QVBoxLayout()
         self.progress_bar_layout.setObjectName("progress_bar_layout")
         self.progress_bar = QtWidgets.QProgressBar(self.dialog)
@@ -134,6 +169,11 @@ class CopyDeformerWeightsUI(object):
         self._progress_bar_steps = 8
         self._progress_bar_value = -1
 
+        self._task = None
+        self._task_timer = QtCore.QTimer(self.dialog)
+        self._task_timer.setInterval(50)
+        self._task_timer.timeout.connect(lambda: self.update_task())
+
         self.buttons_group_box = QtWidgets.QGroupBox(self.dialog)
         self.buttons_group_box.setTitle("")
         self.buttons_group_box.setObjectName("buttons_group_box")
@@ -150,7 +190,7 @@ class CopyDeformerWeightsUI(object):
         self.cancel_button = QtWidgets.QPushButton(self.buttons_group_box)
         self.cancel_button.setObjectName("cancel_button")
         self.cancel_button.setText("Cancel")
-        self.cancel_button.clicked.connect(lambda: self.delete_instances())
+        self.cancel_button.clicked.connect(lambda: self.cancel())
         self.buttons_gb_layout.addWidget(self.cancel_button)
 
         self.main_layout.addWidget(self.buttons_group_box)
@@ -198,6 +238,82 @@ class CopyDeformerWeightsUI(object):
         self.progress_label.show()
         self.progress_label.setText(message)
 
+    def progress_bar_fraction(self, fraction):
+        """
+        Sets the progress bar to a fraction of the work.
+        :param fraction: float between 0 and 1.
+        """
+        self.progress_bar.setValue(int(round(100.0 * fraction)))
+
+    def run_in_background(self, task, on_finished):
+        """
+        Runs a task in a worker thread and calls on_finished with its result in the main thread when it ends. The task
+        must not use the scene. While it runs the progress bar shows its progress and the Cancel button stops it.
+        :param task: Function that receives a progress function, see engine.compute_correspondence.
+        :param on_finished: Function that receives the result of the task.
+        """
+        assert self._task is None, "There is a transfer running"
+        state = {"fraction": 0.0, "done": False, "result": None, "error": None, "cancelled": False,
+                 "cancel": threading.Event(), "on_finished": on_finished}
+
+        def progress(done, total):
+            if state["cancel"].is_set():
+                raise engine.Cancelled()
+            state["fraction"] = float(done) / total if total else 1.0
+
+        def run():
+            try:
+                state["result"] = task(progress)
+            except engine.Cancelled:
+                state["cancelled"] = True
+            except Exception:
+                state["error"] = traceback.format_exc()
+            finally:
+                state["done"] = True
+
+        self._task = state
+        self.copy_button.setEnabled(False)
+        self.progress_bar_fraction(0.0)
+        thread = threading.Thread(target=run, name="copy_deformer_weights")
+        thread.daemon = True
+        thread.start()
+        self._task_timer.start()
+
+    def update_task(self):
+        """
+        Shows the progress of the running task and finishes it in the main thread when it ends.
+        """
+        state = self._task
+        if state is None:
+            self._task_timer.stop()
+            return
+
+        self.progress_bar_fraction(state["fraction"])
+        if not state["done"]:
+            return
+
+        self._task_timer.stop()
+        self._task = None
+        self.copy_button.setEnabled(True)
+        if state["cancelled"]:
+            self.progress_bar_ends(message="Cancelled")
+        elif state["error"]:
+            pm.warning(state["error"])
+            self.progress_bar_ends(message="Finished with errors!")
+        else:
+            state["on_finished"](state["result"])
+
+    def cancel(self):
+        """
+        Stops the running task, the weights are not written. If there is no task running the UI is closed.
+        """
+        if self._task is not None:
+            self._task["cancel"].set()
+            self.progress_label.setText("Cancelling...")
+            self.progress_label.show()
+        else:
+            self.delete_instances()
+
     def get_source_items(self):
         """
         Gets the selected objects in the scene and fills the source lists.
@@ -219,7 +335,7 @@ class CopyDeformerWeightsUI(object):
         Fills the list of deformers according to the selected object in the source object list.
         """
         item = pm.PyNode(self.object_source_list.currentItem().text())
-        self.populate_tree_widget(self.deformer_source_tree, self.get_deformer_list(item))
+        self.populate_tree_widget(self.deformer_source_tree, self.get_deformer_list(item, include_skin_clusters=True))
 
     def get_target_items(self):
         """
@@ -242,25 +358,28 @@ class CopyDeformerWeightsUI(object):
         Fills the list of deformers according to the selected object in the target object list.
         """
         item = pm.PyNode(self.object_target_list.currentItem().text())
-        self.populate_list_widget(self.deformer_target_list, self.get_deformer_list(item))
+        self.populate_tree_widget(self.deformer_target_tree, self.get_deformer_list(item))
 
     @staticmethod
-    def get_deformer_list(item):
+    def get_deformer_list(item, include_skin_clusters=False):
         """
         Returns a list with the deformers connected to a object.
         :param item: PyNode with shapes
+        :param include_skin_clusters: Includes the skinClusters, their influences can be used as source weight maps.
         :return: list
         """
-        deformer_types = ["ffd", "wire", "cluster", "softMod", "deltaMush", "textureDeformer", "nonLinear"]
+        deformer_types = ["ffd", "wire", "cluster", "softMod", "deltaMush", "textureDeformer", "nonLinear",
+                          "blendShape"]
+        if include_skin_clusters:
+            deformer_types.append("skinCluster")
         if pm.objExists(item):
-            deformer_list = list()
-            for shape in item.getShapes():
-                deformer_list.extend(pm.listHistory(shape, ha=1, il=1, pdo=1))
-
+            index = cdw_graph.get_index()
             valid_deformers = list()
-            for deformer in deformer_list:
-                if deformer.type() in deformer_types:
-                    valid_deformers.append(deformer)
+            for shape in item.getShapes():
+                for deformer in index.get_deformers(shape, deformer_types):
+                    deformer = pm.PyNode(deformer)
+                    if deformer not in valid_deformers:
+                        valid_deformers.append(deformer)
 
             return valid_deformers
         else:
@@ -281,6 +400,23 @@ class CopyDeformerWeightsUI(object):
             tree_widget_item.setWhatsThis(0, "deformer")
             tree_widget.addTopLevelItem(tree_widget_item)
 
+            if item.type() == "skinCluster":
+                tree_widget_item.setWhatsThis(0, "skinCluster")
+                for influence in pm.skinCluster(item, q=True, influence=True):
+                    influence_item = QtWidgets.QTreeWidgetItem()
+                    influence_item.setText(0, influence.nodeName())
+                    influence_item.setWhatsThis(0, "influence")
+                    tree_widget_item.addChild(influence_item)
+
+            if item.type() == "blendShape":
+                tree_widget_item.setWhatsThis(0, "blendShape")
+                for blend_shape_map in MayaWeightIO().list_blend_shape_maps(item):
+                    map_item = QtWidgets.QTreeWidgetItem()
+                    map_item.setText(0, blend_shape_map.name)
+                    map_item.setWhatsThis(0, "blendShapeMap")
+                    map_item.setData(0, QtCore.Qt.UserRole, blend_shape_map.target)
+                    tree_widget_item.addChild(map_item)
+
         tree_widget.blockSignals(False)
 
     @staticmethod
@@ -306,22 +442,139 @@ class CopyDeformerWeightsUI(object):
         """
         assert self.transfer_function is not None, "The transfer_function variable must be contain a transfer_function function."
 
+        if self.batch_check_box.isChecked():
+            self.copy_deformer_weights_batch()
+            return
+
+        source_item = self.deformer_source_tree.currentItem()
+        target_item = self.deformer_target_tree.currentItem()
+        if source_item and target_item and source_item.whatsThis(0) == target_item.whatsThis(0) == "blendShape":
+            self.copy_blend_shape_maps()
+            return
+
         geo_source = self.object_source_list.currentItem()
         geo_target = self.object_target_list.currentItem()
-        deformer_source = self.deformer_source_tree.currentItem()
-        deformer_target = self.deformer_target_list.currentItem()
+        deformer_source = self.get_source_deformer()
+        deformer_target = self.get_item_deformer(target_item)
 
         if geo_source and geo_target and deformer_source and deformer_target:
             data = {"geo_source": pm.PyNode(geo_source.text()),
                     "geo_target": pm.PyNode(geo_target.text()),
-                    "deformer_source": pm.PyNode(deformer_source.text(0)),
-                    "deformer_target": pm.PyNode(deformer_target.text()),
-                    "surface_association": "closestPoint",
+                    "deformer_source": deformer_source,
+                    "deformer_target": deformer_target,
+                    "surface_association": self.association_combo_box.currentText(),
+                    "use_component_selection": self.components_check_box.isChecked(),
                     "interface": self,
                     }
 
             self.transfer_function(**data)
 
+    def copy_deformer_weights_batch(self):
+        """
+        Copies the source weight map to every selected target object.
+        """
+        assert self.batch_transfer_function is not None, \
+            "The batch_transfer_function variable must be contain a batch transfer function."
+
+        geo_source = self.object_source_list.currentItem()
+        deformer_source = self.get_source_deformer()
+        deformer_target = self.get_item_deformer(self.deformer_target_tree.currentItem())
+        geo_targets = self.object_target_list.selectedItems()
+
+        if geo_source and deformer_source and deformer_target and geo_targets:
+            targets = list()
+            for item in geo_targets:
+                geo_target = pm.PyNode(item.text())
+                target_deformer = self.get_batch_target_deformer(geo_target, deformer_target)
+                if target_deformer:
+                    targets.append((geo_target, target_deformer))
+                else:
+                    pm.warning("{} does not have a deformer like {}".format(geo_target, deformer_target))
+
+            data = {"geo_source": pm.PyNode(geo_source.text()),
+                    "deformer_source": deformer_source,
+                    "targets": targets,
+                    "surface_association": self.association_combo_box.currentText(),
+                    "interface": self,
+                    }
+
+            self.batch_transfer_function(**data)
+
+    def copy_blend_shape_maps(self):
+        """
+        Copies all the weight maps of the source blendShape to the target blendShape, matching them by name.
+        """
+        assert self.maps_transfer_function is not None, \
+            "The maps_transfer_function variable must be contain a blendShape maps transfer function."
+
+        geo_source = self.object_source_list.currentItem()
+        geo_target = self.object_target_list.currentItem()
+
+        if geo_source and geo_target:
+            data = {"geo_source": pm.PyNode(geo_source.text()),
+                    "blend_shape_source": pm.PyNode(self.deformer_source_tree.currentItem().text(0)),
+                    "geo_target": pm.PyNode(geo_target.text()),
+                    "blend_shape_target": pm.PyNode(self.deformer_target_tree.currentItem().text(0)),
+                    "surface_association": self.association_combo_box.currentText(),
+                    "interface": self,
+                    }
+
+            self.maps_transfer_function(**data)
+
+    def get_source_deformer(self):
+        """
+        Returns the source deformer selected in the source tree. The influences of a skinCluster are returned as a
+        SkinInfluence, a skinCluster without influence is not a valid source.
+        :return: PyNode, SkinInfluence, BlendShapeMap or None
+        """
+        item = self.deformer_source_tree.currentItem()
+        if item and item.whatsThis(0) == "skinCluster":
+            pm.warning("Select an influence of the skinCluster {}".format(item.text(0)))
+            return None
+        return self.get_item_deformer(item)
+
+    @staticmethod
+    def get_item_deformer(item):
+        """
+        Returns the deformer of an item of a deformer tree. The influences of a skinCluster are returned as a
+        SkinInfluence and the maps of a blendShape as a BlendShapeMap.
+        :param item: QTreeWidgetItem or None.
+        :return: PyNode, SkinInfluence, BlendShapeMap or None
+        """
+        if not item:
+            return None
+        if item.whatsThis(0) == "influence":
+            return SkinInfluence(item.parent().text(0), item.text(0))
+        if item.whatsThis(0) == "blendShapeMap":
+            return BlendShapeMap(item.parent().text(0), item.data(0, QtCore.Qt.UserRole), item.text(0))
+        return pm.PyNode(item.text(0))
+
+    def get_batch_target_deformer(self, geo_target, deformer):
+        """
+        Returns the deformer of a target object used in batch mode: the selected target deformer if it deforms the
+        object, or else the first deformer of the object with the same type. The maps of a blendShape are matched by
+        name in the blendShapes of the object.
+        :param geo_target: PyNode of the target object.
+        :param deformer: PyNode or BlendShapeMap of the selected target deformer.
+        :return: PyNode, BlendShapeMap or None
+        """
+        deformers = self.get_deformer_list(geo_target)
+        if isinstance(deformer, BlendShapeMap):
+            for each_deformer in deformers:
+                if each_deformer.type() != "blendShape":
+                    continue
+                for blend_shape_map in MayaWeightIO().list_blend_shape_maps(each_deformer):
+                    if blend_shape_map.name == deformer.name:
+                        return blend_shape_map
+            return None
+
+        if deformer in deformers:
+            return deformer
+        for each_deformer in deformers:
+            if each_deformer.type() == deformer.type():
+                return each_deformer
+        return None
+
     def show(self):
         """
         Shows the CopyDeformerWeights UI.
@@ -344,6 +597,8 @@ class CopyDeformerWeightsUI(object):
         """
         Deletes the UI
         """
+        if getattr(self, "_task", None) is not None:
+            self._task["cancel"].set()
         if pm.window(self.dialog_name, exists=True):
             pm.deleteUI(self.dialog_name)
 
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_batch.py - Python Script
+##################################################################################
+# Description:
+# Headless batch transfers. A job manifest lists the weight maps to copy and the scene files, geometries and
+# deformers that receive them. The jobs of each scene file run together in a worker process, the source data is
+# kept in the cache of the worker between jobs, and a JSON report with the timings and the failures of every job
+# is written at the end.
+#
+# The scenes are accessed through the Scene interface. MayaScene opens the scene files with Maya standalone and
+# MemoryScene keeps the geometries and the weights in memory, so the scheduler can be tested outside Maya.
+#
+# Usage:
+#     mayapy jlr_copy_deformer_weights_batch.py manifest.json --workers 4 --report report.json
+#
+# Manifest:
+#     {"jobs": [{"name": "shirt",
+#                "scene": "assets/shirt.ma",
+#                "source": {"archive": "body_weights.cdw", "geometry": "bodyShape", "map": "cluster1"},
+#                "targets": [{"geometry": "shirt*", "deformer": "cluster*"}],
+#                "surface_association": "rayCast",
+#                "max_distance": 2.0,
+#                "save": true}]}
+#
+# A source can be a map of a weight map file written by export_deformer_weights, or a deformer of a geometry of the
+# scene: {"geometry": "body", "deformer": "cluster1"}. The target geometries and deformers are fnmatch patterns.
+# max_distance limits the rayCast hits, it is optional.
+# Relative paths are relative to the manifest.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import sys
+import traceback
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+import jlr_copy_deformer_weights_cache as cdw_cache
+import jlr_copy_deformer_weights_engine as engine
+import jlr_copy_deformer_weights_files as cdw_files
+import jlr_copy_deformer_weights_io as cdw_io
+import jlr_copy_deformer_weights_profile as cdw_profile
+
+
+class Scene(object):
+    """
+    Interface to the geometries and the weights of a scene file.
+    """
+
+    path = None
+    weight_io = None
+
+    def open(self, path):
+        """
+        Opens a scene file.
+        :param path: File path.
+        """
+        raise NotImplementedError
+
+    def save(self):
+        """
+        Saves the opened scene file.
+        """
+        raise NotImplementedError
+
+    def list_geometries(self):
+        """
+        Returns the names of the deformable geometries of the scene.
+        :return: list of str
+        """
+        raise NotImplementedError
+
+    def list_deformers(self, geometry):
+        """
+        Returns the names of the deformers of a geometry.
+        :param geometry: Geometry name.
+        :return: list of str
+        """
+        raise NotImplementedError
+
+    def get_points(self, geometry):
+        """
+        Returns the world space positions of the points of a geometry.
+        :param geometry: Geometry name.
+        :return: (n, 3) float64 array.
+        """
+        raise NotImplementedError
+
+    def get_triangles(self, geometry):
+        """
+        Returns the vertex indices of the triangles of a geometry.
+        :param geometry: Geometry name.
+        :return: (m, 3) int array.
+        """
+        raise NotImplementedError
+
+    def get_normals(self, geometry):
+        """
+        Returns the world space normals of the points of a geometry.
+        :param geometry: Geometry name.
+        :return: (n, 3) float64 array.
+        """
+        return engine.vertex_normals(self.get_points(geometry), self.get_triangles(geometry))
+
+    def get_fingerprint(self, geometry):
+        """
+        Returns a fingerprint of the points and the topology of a geometry.
+        :param geometry: Geometry name.
+        :return: str
+        """
+        return cdw_cache.array_fingerprint(self.get_points(geometry), self.get_triangles(geometry))
+
+
+class MayaScene(Scene):
+    """
+    Scene files opened with Maya. Maya standalone is initialized the first time a file is opened, so the scene can
+    be created before starting the worker processes.
+    """
+
+    def __init__(self):
+        self.weight_io = cdw_io.MayaWeightIO()
+
+    def open(self, path):
+        initialize_maya()
+        cdw_io.cmds.file(path, open=True, force=True)
+        self.path = path
+
+    def save(self):
+        cdw_io.cmds.file(save=True, force=True)
+
+    def list_geometries(self):
+        cmds = cdw_io.cmds
+        geometries = list()
+        for shape in cmds.ls(type="mesh", noIntermediate=True, long=True) or list():
+            geometries.extend(cmds.listRelatives(shape, parent=True) or list())
+        return sorted(set(geometries))
+
+    def list_deformers(self, geometry):
+        cmds = cdw_io.cmds
+        history = cmds.listHistory(cdw_io.get_shape(geometry), pruneDagObjects=True, interestLevel=1) or list()
+        return [node for node in history if cmds.objectType(node, isAType="geometryFilter")]
+
+    def get_points(self, geometry):
+        om = cdw_io.om
+        it_geometry = om.MItGeometry(cdw_io.get_dag_path(cdw_io.get_shape(geometry)))
+        return np.array(it_geometry.allPositions(om.MSpace.kWorld), dtype=np.float64).reshape(-1, 4)[:, :3]
+
+    def get_triangles(self, geometry):
+        _, vertices = cdw_io.om.MFnMesh(cdw_io.get_dag_path(cdw_io.get_shape(geometry))).getTriangles()
+        return np.array(vertices, dtype=np.int64).reshape(-1, 3)
+
+    def get_normals(self, geometry):
+        om = cdw_io.om
+        normals = om.MFnMesh(cdw_io.get_dag_path(cdw_io.get_shape(geometry))).getVertexNormals(False,
+                                                                                               om.MSpace.kWorld)
+        return np.array(normals, dtype=np.float64).reshape(-1, 3)
+
+
+class MemoryScene(Scene):
+    """
+    Scene kept in memory. Every file opens the same geometries and weights, the opened and saved files are recorded.
+    """
+
+    def __init__(self):
+        self.weight_io = cdw_io.MemoryWeightIO()
+        self.geometries = OrderedDict()
+        self.deformers = dict()
+        self.opened = list()
+        self.saved = list()
+
+    def add_geometry(self, geometry, points, triangles):
+        """
+        Adds a geometry.
+        :param geometry: Geometry name.
+        :param points: (n, 3) array with the world space positions of the points.
+        :param triangles: (m, 3) array with the vertex indices of the triangles.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.geometries[geometry] = (points, np.asarray(triangles, dtype=np.int64).reshape(-1, 3))
+        self.deformers[geometry] = list()
+        self.weight_io.add_geometry(geometry, len(points))
+
+    def add_deformer(self, deformer, geometry, weights=None):
+        """
+        Adds a deformer to a geometry.
+        :param deformer: Deformer name.
+        :param geometry: Geometry name, it must be added with add_geometry.
+        :param weights: Initial weights, dense array or WeightMap. By default the weight list is not initialized.
+        """
+        self.weight_io.add_deformer(deformer, geometry, weights)
+        self.deformers[geometry].append(deformer)
+
+    def open(self, path):
+        self.path = path
+        self.opened.append(path)
+
+    def save(self):
+        self.saved.append(self.path)
+
+    def list_geometries(self):
+        return list(self.geometries)
+
+    def list_deformers(self, geometry):
+        return list(self.deformers[geometry])
+
+    def get_points(self, geometry):
+        return self.geometries[geometry][0]
+
+    def get_triangles(self, geometry):
+        return self.geometries[geometry][1]
+
+
+def initialize_maya():
+    """
+    Initializes Maya standalone if the Maya commands are not available yet.
+    """
+    try:
+        cdw_io.cmds.about(version=True)
+    except AttributeError:
+        import maya.standalone
+        maya.standalone.initialize(name="python")
+
+
+def load_manifest(path):
+    """
+    Reads a job manifest. The relative paths of the scenes and the weight map files are resolved from the folder of
+    the manifest, and the jobs without name get their index as name.
+    :param path: File path.
+    :return: dict
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+
+    folder = os.path.dirname(os.path.abspath(path))
+    for index, job in enumerate(manifest.get("jobs", list())):
+        job.setdefault("name", str(index))
+        if job.get("scene"):
+            job["scene"] = os.path.join(folder, job["scene"])
+        if job["source"].get("archive"):
+            job["source"]["archive"] = os.path.join(folder, job["source"]["archive"])
+    return manifest
+
+
+def prepare_job_source(source, scene, cache=None):
+    """
+    Returns the SourceSurface and the weight map of the source of a job. The surfaces are reused from the cache.
+    :param source: dict with the source of the job.
+    :param scene: Scene with the opened scene file.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: tuple with the SourceSurface and the WeightMap.
+    """
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    if source.get("archive"):
+        archive = cdw_files.WeightArchive(source["archive"])
+        geometry = source.get("geometry")
+        if geometry is None:
+            geometry = archive.get_map_description(source["map"])["geometry"]
+        points, triangles = archive.get_geometry(geometry)
+        surface = cache.get_or_create(("archive", source["archive"], geometry),
+                                      cdw_cache.array_fingerprint(points, triangles),
+                                      lambda: engine.SourceSurface(points, triangles))
+        return surface, archive.get_weight_map(source["map"], geometry)
+
+    geometry = source["geometry"]
+    surface = cache.get_or_create(("scene", scene.path, geometry), scene.get_fingerprint(geometry),
+                                  lambda: engine.SourceSurface(scene.get_points(geometry),
+                                                               scene.get_triangles(geometry)))
+    return surface, scene.weight_io.read_weight_map(source["deformer"], geometry)
+
+
+def find_targets(patterns, scene, exclude=None):
+    """
+    Returns the geometries and the deformers of a scene that match some patterns.
+    :param patterns: list of dicts with fnmatch patterns of the geometry and of the deformer.
+    :param scene: Scene with the opened scene file.
+    :param exclude: tuple (geometry, deformer) that is not returned, the source of the job.
+    :return: list of tuples (geometry, deformer).
+    """
+    targets = list()
+    for pattern in patterns:
+        for geometry in scene.list_geometries():
+            if not fnmatch.fnmatchcase(geometry, pattern.get("geometry", "*")):
+                continue
+            for deformer in scene.list_deformers(geometry):
+                target = (geometry, deformer)
+                if (fnmatch.fnmatchcase(deformer, pattern.get("deformer", "*")) and target != exclude
+                        and target not in targets and scene.weight_io.has_weights(deformer, geometry)):
+                    targets.append(target)
+    return targets
+
+
+def run_job(job, scene, cache=None):
+    """
+    Runs a job in the opened scene. The errors are stored in the report instead of being raised.
+    :param job: dict with the job.
+    :param scene: Scene with the opened scene file.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: dict with the report of the job.
+    """
+    start = default_timer()
+    cache = cdw_cache.SOURCE_CACHE if cache is None else cache
+    surface_association = job.get("surface_association", "closestPoint")
+    max_distance = job.get("max_distance")
+    report = {"name": job["name"], "scene": job.get("scene"), "status": "ok", "error": None, "targets": list()}
+    stats = cdw_profile.TransferStats(job["name"])
+    stats.info.update(scene=job.get("scene"), surface_association=surface_association, max_distance=max_distance)
+
+    with stats.measure(scene.weight_io, cache):
+        try:
+            with stats.phase("prepare_source"):
+                surface, weight_map = prepare_job_source(job["source"], scene, cache)
+            report["prepare_seconds"] = default_timer() - start
+            exclude = None if job["source"].get("archive") else (job["source"]["geometry"],
+                                                                 job["source"]["deformer"])
+            with stats.phase("find_targets"):
+                targets = find_targets(job["targets"], scene, exclude)
+            if not targets:
+                raise ValueError("No target matches {}".format(job["targets"]))
+        except Exception as e:
+            report.update(status="failed", error="{}: {}".format(type(e).__name__, e),
+                          traceback=traceback.format_exc())
+            targets = list()
+
+        for geometry, deformer in targets:
+            target_report = {"geometry": geometry, "deformer": deformer, "status": "ok", "error": None}
+            report["targets"].append(target_report)
+            try:
+                target_start = default_timer()
+                with stats.phase("read_target"):
+                    points = scene.get_points(geometry)
+                    normals = scene.get_normals(geometry) if surface_association == "rayCast" else None
+                with stats.phase("correspondence"):
+                    correspondence = engine.compute_correspondence(surface, points, surface_association,
+                                                                   target_normals=normals, max_distance=max_distance)
+                with stats.phase("interpolate"):
+                    target_weight_map = correspondence.apply(weight_map)
+                write_start = default_timer()
+                with stats.phase("write"):
+                    scene.weight_io.write_weight_map(deformer, geometry, target_weight_map)
+                target_report.update(vertices=len(points), compute_seconds=write_start - target_start,
+                                     write_seconds=default_timer() - write_start)
+                stats.count("target_vertices", len(points))
+            except Exception as e:
+                target_report.update(status="failed", error="{}: {}".format(type(e).__name__, e),
+                                     traceback=traceback.format_exc())
+                report.update(status="failed", error="{} of {} targets failed".format(
+                    sum(target["status"] == "failed" for target in report["targets"]), len(targets)))
+
+    report["seconds"] = default_timer() - start
+    report["stats"] = stats.finish().to_dict()
+    return report
+
+
+def run_scene_jobs(scene_path, jobs, scene, cache=None):
+    """
+    Opens a scene file, runs its jobs and saves it if a job asks for it and nothing failed.
+    :param scene_path: File path, or None to use the scene that is already opened.
+    :param jobs: list of dicts with the jobs.
+    :param scene: Scene used to open the file.
+    :param cache: SourceCache. By default the module cache SOURCE_CACHE.
+    :return: list of dicts with the reports of the jobs.
+    """
+    try:
+        if scene_path:
+            scene.open(scene_path)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+        return [{"name": job["name"], "scene": scene_path, "status": "failed", "error": error, "targets": list(),
+                 "traceback": traceback.format_exc()} for job in jobs]
+
+    reports = [run_job(job, scene, cache) for job in jobs]
+    if any(job.get("save") for job in jobs) and all(report["status"] == "ok" for report in reports):
+        scene.save()
+    return reports
+
+
+_worker_scene = None
+
+
+def _initialize_worker(scene):
+    global _worker_scene
+    _worker_scene = scene
+
+
+def _run_worker_scene_jobs(arguments):
+    return run_scene_jobs(arguments[0], arguments[1], _worker_scene)
+
+
+def run_manifest(manifest, scene=None, workers=None):
+    """
+    Runs the jobs of a manifest. The jobs are grouped by scene file and each group runs in a worker process, so
+    every file is opened once and the source data is reused between the jobs of a worker.
+    :param manifest: dict with the manifest, see load_manifest.
+    :param scene: Scene used to open the files. By default a MayaScene.
+    :param workers: Number of worker processes. By default the number of CPUs. With 1 the jobs run in this process.
+    :return: dict with the report.
+    """
+    start = default_timer()
+    scene = MayaScene() if scene is None else scene
+    jobs = manifest.get("jobs", list())
+    groups = OrderedDict()
+    for job in jobs:
+        groups.setdefault(job.get("scene"), list()).append(job)
+
+    workers = min(workers or multiprocessing.cpu_count(), max(len(groups), 1))
+    if workers <= 1:
+        results = [run_scene_jobs(scene_path, scene_jobs, scene) for scene_path, scene_jobs in groups.items()]
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_initialize_worker, initargs=(scene,))
+        try:
+            results = pool.map(_run_worker_scene_jobs, list(groups.items()), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    # The reports are returned in the order of the manifest.
+    reports = dict((id(job), report) for scene_jobs, scene_reports in zip(groups.values(), results)
+                   for job, report in zip(scene_jobs, scene_reports))
+    job_reports = [reports[id(job)] for job in jobs]
+
+    seconds = default_timer() - start
+    vertices = sum(target.get("vertices", 0) for report in job_reports for target in report["targets"])
+    stats = cdw_profile.TransferStats.aggregate([cdw_profile.TransferStats.from_dict(report["stats"])
+                                                 for report in job_reports if "stats" in report], "run_manifest")
+    return {"workers": workers,
+            "stats": stats.to_dict(),
+            "jobs": job_reports,
+            "succeeded": sum(report["status"] == "ok" for report in job_reports),
+            "failed": sum(report["status"] != "ok" for report in job_reports),
+            "vertices": vertices,
+            "seconds": seconds,
+            "vertices_per_second": vertices / seconds if seconds else 0.0,
+            }
+
+
+def write_report(report, path):
+    """
+    Writes a report as JSON.
+    :param report: dict returned by run_manifest.
+    :param path: File path.
+    """
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+    :param argv: list with the arguments. By default the arguments of the command line.
+    :return: Exit code, 1 if a job failed.
+    """
+    parser = argparse.ArgumentParser(description="Copies deformer weights as described by a job manifest.")
+    parser.add_argument("manifest", help="JSON file with the jobs.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--report", default=None, help="JSON file for the report. By default next to the manifest.")
+    arguments = parser.parse_args(argv)
+
+    report = run_manifest(load_manifest(arguments.manifest), workers=arguments.workers)
+    report["manifest"] = os.path.abspath(arguments.manifest)
+    report_path = arguments.report or os.path.splitext(arguments.manifest)[0] + "_report.json"
+    write_report(report, report_path)
+
+    print("{} jobs succeeded, {} failed in {:.2f}s. Report: {}".format(report["succeeded"], report["failed"],
+                                                                      report["seconds"], report_path))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_benchmark.py - Python Script
+##################################################################################
+# Description:
+# Benchmark of the transfer engine and of the weight I/O. It builds synthetic meshes (grids and spheres, with
+# offset and remeshed targets) and random sparse and dense weight maps, and measures the time and the peak memory
+# of the transfers, of the reads and writes of the weights through a MemoryWeightIO, of the mirror correspondence,
+# of the sparse weight map conversions and of the weight map operations. It does not need Maya.
+#
+# The results are written as JSON and can be compared with a baseline, a case is a regression when its time or
+# its peak memory grows more than a threshold.
+#
+# Usage:
+#     python jlr_copy_deformer_weights_benchmark.py --sizes 1000 10000 100000 --output results.json
+#     python jlr_copy_deformer_weights_benchmark.py --baseline results.json --time-threshold 0.25
+#
+# Author: Juan Lara.
+##################################################################################
+
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+import jlr_copy_deformer_weights_engine as engine
+import jlr_copy_deformer_weights_io as cdw_io
+import jlr_copy_deformer_weights_mirror as cdw_mirror
+import jlr_copy_deformer_weights_ops as cdw_ops
+from jlr_copy_deformer_weights_weightmap import WeightMap, merge_for_write
+
+BENCHMARK_VERSION = 1
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_TIME_THRESHOLD = 0.25
+DEFAULT_MEMORY_THRESHOLD = 0.10
+# Times below this are dominated by noise and are not compared.
+MIN_COMPARED_SECONDS = 0.05
+# The fast cases are run until they add up to this time, so their best time is stable.
+MIN_MEASURED_SECONDS = 0.2
+MAX_RUNS = 100
+
+
+def grid_mesh(n_vertices, size=10.0):
+    """
+    Returns a square grid in the XZ plane, centered in the origin.
+    :param n_vertices: Approximate number of vertices.
+    :param size: Width of the grid.
+    :return: tuple with an (n, 3) float64 array of points and an (m, 3) int32 array of triangles.
+    """
+    side = max(int(round(np.sqrt(n_vertices))), 2)
+    u, v = np.meshgrid(np.linspace(-0.5, 0.5, side), np.linspace(-0.5, 0.5, side))
+    points = np.stack([u.ravel(), np.zeros(side * side), v.ravel()], axis=1) * size
+
+    quads = (np.arange(side - 1)[:, None] * side + np.arange(side - 1)).ravel()
+    triangles = np.concatenate([np.stack([quads, quads + side, quads + 1], axis=1),
+                                np.stack([quads + 1, quads + side, quads + side + 1], axis=1)])
+    return points, triangles.astype(np.int32)
+
+
+def sphere_mesh(n_vertices, radius=5.0):
+    """
+    Returns a UV sphere centered in the origin.
+    :param n_vertices: Approximate number of vertices.
+    :param radius: Radius of the sphere.
+    :return: tuple with an (n, 3) float64 array of points and an (m, 3) int32 array of triangles.
+    """
+    rings = max(int(round(np.sqrt(n_vertices / 2.0))), 3)
+    segments = max(int(round(float(n_vertices) / rings)), 3)
+    theta = np.linspace(0.0, np.pi, rings + 2)[1:-1]
+    phi = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing="ij")
+    points = np.stack([np.sin(theta) * np.cos(phi), np.cos(theta), np.sin(theta) * np.sin(phi)], axis=-1)
+    points = np.concatenate([[[0.0, 1.0, 0.0]], points.reshape(-1, 3), [[0.0, -1.0, 0.0]]]) * radius
+
+    ring = np.arange(segments)
+    following = (ring + 1) % segments
+    triangles = [np.stack([np.zeros(segments, dtype=np.int64), following + 1, ring + 1], axis=1)]
+    for r in range(rings - 1):
+        a = 1 + r * segments + ring
+        b = 1 + r * segments + following
+        triangles.append(np.stack([a, b, a + segments], axis=1))
+        triangles.append(np.stack([b, b + segments, a + segments], axis=1))
+    last = len(points) - 1
+    triangles.append(np.stack([last - segments + ring, last - segments + following,
+                               np.full(segments, last)], axis=1))
+    return points, np.concatenate(triangles).astype(np.int32)
+
+
+def offset_mesh(points, triangles, distance=0.05, noise=0.01, seed=0):
+    """
+    Returns a copy of a mesh moved along its normals with some noise, like a garment over a body.
+    :param points: (n, 3) array with the points.
+    :param triangles: (m, 3) array with the triangles.
+    :param distance: Distance along the normals.
+    :param noise: Maximum random displacement.
+    :param seed: Seed of the noise.
+    :return: (n, 3) float64 array.
+    """
+    normals = engine.vertex_normals(points, triangles)
+    random = np.random.RandomState(seed)
+    return points + normals * distance + random.uniform(-noise, noise, points.shape)
+
+
+def get_meshes(shape, n_vertices):
+    """
+    Returns a source mesh and its targets: the same mesh offset along its normals and a remeshed version with
+    another resolution.
+    :param shape: grid or sphere.
+    :param n_vertices: Approximate number of vertices of the source.
+    :return: dict with tuples (points, triangles) by name: source, offset and remeshed.
+    """
+    function = {"grid": grid_mesh, "sphere": sphere_mesh}[shape]
+    points, triangles = function(n_vertices)
+    remeshed_points, remeshed_triangles = function(int(n_vertices * 0.7))
+    return {"source": (points, triangles),
+            "offset": (offset_mesh(points, triangles), triangles),
+            "remeshed": (offset_mesh(remeshed_points, remeshed_triangles, seed=1), remeshed_triangles)}
+
+
+def random_weight_map(n_points, density, seed=0):
+    """
+    Returns a random weight map.
+    :param n_points: Number of points.
+    :param density: Fraction of the points with a weight that is not zero.
+    :param seed: Random seed.
+    :return: WeightMap
+    """
+    random = np.random.RandomState(seed)
+    indices = np.flatnonzero(random.uniform(size=n_points) < density)
+    return WeightMap(n_points, indices, random.uniform(size=len(indices)))
+
+
+def measure(function, repeats=3):
+    """
+    Runs a function several times and measures its best time and its peak memory. The first run is a warm up and
+    it is not timed.
+    :param function: Function without arguments.
+    :param repeats: Minimum number of timed runs. The fast functions are run until the runs take
+    MIN_MEASURED_SECONDS, up to MAX_RUNS.
+    :return: dict with the best seconds, the number of timed runs and the peak of memory allocated by the function,
+    in bytes.
+    """
+    function()
+    seconds = list()
+    while len(seconds) < repeats or (sum(seconds) < MIN_MEASURED_SECONDS and len(seconds) < MAX_RUNS):
+        start = default_timer()
+        function()
+        seconds.append(default_timer() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(seconds), "runs": len(seconds), "peak_bytes": peak}
+
+
+def benchmark_transfer(meshes, weight_maps, repeats=3):
+    """
+    Measures the preparation of the source surface and the transfers to the targets.
+    :param meshes: dict returned by get_meshes.
+    :param weight_maps: dict with source WeightMaps by name.
+    :param repeats: Number of runs of each case.
+    :return: dict with the results by case name.
+    """
+    results = OrderedDict()
+    points, triangles = meshes["source"]
+    results["surface"] = measure(lambda: engine.SourceSurface(points, triangles), repeats)
+    results["surface"]["items"] = len(triangles)
+    surface = engine.SourceSurface(points, triangles)
+
+    for target_name in ("offset", "remeshed"):
+        target_points, target_triangles = meshes[target_name]
+        target_normals = engine.vertex_normals(target_points, target_triangles)
+        for association in engine.SURFACE_ASSOCIATIONS:
+            normals = target_normals if association == "rayCast" else None
+            result = measure(lambda: engine.compute_correspondence(surface, target_points, association,
+                                                                   target_normals=normals), repeats)
+            result["items"] = len(target_points)
+            results["correspondence.{}.{}".format(target_name, association)] = result
+
+        correspondence = engine.compute_correspondence(surface, target_points)
+        for map_name, weight_map in weight_maps.items():
+            result = measure(lambda: correspondence.apply(weight_map), repeats)
+            result["items"] = len(target_points)
+            results["apply.{}.{}".format(target_name, map_name)] = result
+    return results
+
+
+def benchmark_io(n_points, weight_maps, repeats=3):
+    """
+    Measures the reads and the writes of weight maps through a MemoryWeightIO, and the number of calls they need.
+    :param n_points: Number of points of the geometry.
+    :param weight_maps: dict with WeightMaps by name.
+    :param repeats: Number of runs of each case.
+    :return: dict with the results by case name.
+    """
+    results = OrderedDict()
+    for map_name, weight_map in weight_maps.items():
+        weight_io = cdw_io.MemoryWeightIO()
+        weight_io.add_geometry("geometry", n_points)
+        weight_io.add_deformer("deformer", "geometry", weight_map)
+
+        def read():
+            return weight_io.read_weight_map("deformer", "geometry")
+
+        def write():
+            # The first write of a map that is not initialized writes every point, the next ones only the changes.
+            weight_io.add_deformer("target", "geometry")
+            weight_io.write_weight_map("target", "geometry", weight_map)
+            weight_io.write_weight_map("target", "geometry", weight_map)
+
+        for name, function in (("read", read), ("write", write), ("read_dense", lambda: read().to_dense())):
+            calls = (weight_io.read_calls, weight_io.write_calls, weight_io.weights_read, weight_io.weights_written)
+            result = measure(function, repeats)
+            # The warm up, the timed runs and the run that measures the memory.
+            runs = result["runs"] + 2
+            result.update(items=n_points,
+                          read_calls=(weight_io.read_calls - calls[0]) // runs,
+                          write_calls=(weight_io.write_calls - calls[1]) // runs,
+                          weights_read=(weight_io.weights_read - calls[2]) // runs,
+                          weights_written=(weight_io.weights_written - calls[3]) // runs)
+            results["io.{}.{}".format(name, map_name)] = result
+    return results
+
+
+def benchmark_mirror(points, triangles, repeats=3):
+    """
+    Measures the mirror correspondence of a symmetric mesh and a mirror of a weight map.
+    :param points: (n, 3) array with the points.
+    :param triangles: (m, 3) array with the triangles.
+    :param repeats: Number of runs of each case.
+    :return: dict with the results by case name.
+    """
+    results = OrderedDict()
+    results["mirror.correspondence"] = measure(lambda: cdw_mirror.mirror_correspondence(points, triangles), repeats)
+    correspondence = cdw_mirror.mirror_correspondence(points, triangles)
+    receiving = cdw_mirror.get_receiving_points(points)
+    weights = random_weight_map(len(points), 0.5).to_dense()
+    results["mirror.weights"] = measure(lambda: cdw_mirror.mirror_weights(weights, correspondence, receiving),
+                                        repeats)
+    for result in results.values():
+        result["items"] = len(points)
+    return results
+
+
+def benchmark_sparse(n_points, weight_maps, repeats=3):
+    """
+    Measures the conversions of the sparse weight maps.
+    :param n_points: Number of points of the weight maps.
+    :param weight_maps: dict with WeightMaps by name.
+    :param repeats: Number of runs of each case.
+    :return: dict with the results by case name.
+    """
+    results = OrderedDict()
+    for map_name, weight_map in weight_maps.items():
+        dense = weight_map.to_dense()
+        changed = weight_map.update(np.arange(0, n_points, 7), np.full(len(range(0, n_points, 7)), 0.5))
+        results["sparse.from_dense.{}".format(map_name)] = measure(lambda: WeightMap.from_dense(dense), repeats)
+        results["sparse.to_dense.{}".format(map_name)] = measure(weight_map.to_dense, repeats)
+        results["sparse.merge_for_write.{}".format(map_name)] = measure(lambda: merge_for_write(weight_map, changed),
+                                                                        repeats)
+        results["sparse.fill_missing.{}".format(map_name)] = measure(weight_map.fill_missing, repeats)
+    for result in results.values():
+        result["items"] = n_points
+    return results
+
+
+def benchmark_ops(points, triangles, weight_maps, repeats=3):
+    """
+    Measures the vertex adjacency and the weight map operations.
+    :param points: (n, 3) array with the points.
+    :param triangles: (m, 3) array with the triangles.
+    :param weight_maps: dict with WeightMaps by name.
+    :param repeats: Number of runs of each case.
+    :return: dict with the results by case name.
+    """
+    results = OrderedDict()
+    results["ops.adjacency"] = measure(lambda: cdw_ops.VertexAdjacency.from_triangles(len(points), triangles),
+                                       repeats)
+    adjacency = cdw_ops.VertexAdjacency.from_triangles(len(points), triangles)
+    weights = np.stack([weight_map.to_dense() for weight_map in weight_maps.values()])
+    results["ops.smooth"] = measure(lambda: cdw_ops.smooth(weights, adjacency, iterations=10), repeats)
+    results["ops.combine"] = measure(lambda: cdw_ops.combine(weights, weights[0], "multiply", 0.5), repeats)
+    results["ops.remap"] = measure(lambda: cdw_ops.remap(weights, [(0.0, 0.0), (0.5, 1.0), (1.0, 0.0)], "smooth"),
+                                   repeats)
+    for result in results.values():
+        result["items"] = len(points)
+    return results
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, shapes=("grid", "sphere"), repeats=3, log=None):
+    """
+    Runs all the benchmarks.
+    :param sizes: Approximate numbers of vertices of the source meshes.
+    :param shapes: Shapes of the meshes: grid and sphere.
+    :param repeats: Number of runs of each case, the best time is kept.
+    :param log: Function called with a message after each group of cases.
+    :return: dict with the results, see compare.
+    """
+    results = OrderedDict()
+    for size in sizes:
+        for shape in shapes:
+            meshes = get_meshes(shape, size)
+            points, triangles = meshes["source"]
+            n_points = len(points)
+            weight_maps = OrderedDict([("sparse", random_weight_map(n_points, 0.05)),
+                                       ("dense", random_weight_map(n_points, 1.0))])
+
+            group = OrderedDict()
+            group.update(benchmark_transfer(meshes, weight_maps, repeats))
+            group.update(benchmark_io(n_points, weight_maps, repeats))
+            if shape == "sphere":
+                group.update(benchmark_mirror(points, triangles, repeats))
+            group.update(benchmark_sparse(n_points, weight_maps, repeats))
+            group.update(benchmark_ops(points, triangles, weight_maps, repeats))
+
+            for name, result in group.items():
+                result["items_per_second"] = result["items"] / result["seconds"] if result["seconds"] else 0.0
+                results["{}.{}.{}".format(shape, size, name)] = result
+            if log:
+                log("{} {}: {} cases, {:.2f}s".format(shape, size, len(group),
+                                                       sum(result["seconds"] for result in group.values())))
+
+    return {"version": BENCHMARK_VERSION,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "results": results,
+            }
+
+
+def compare(current, baseline, time_threshold=DEFAULT_TIME_THRESHOLD, memory_threshold=DEFAULT_MEMORY_THRESHOLD):
+    """
+    Compares some results with a baseline. The cases that are not in both results are ignored. The times are compared
+    with at least MIN_COMPARED_SECONDS, so the noise of the fast cases is not reported.
+    :param current: dict returned by run_benchmarks.
+    :param baseline: dict returned by run_benchmarks.
+    :param time_threshold: Maximum relative growth of the time.
+    :param memory_threshold: Maximum relative growth of the peak memory.
+    :return: list of dicts with the regressions.
+    """
+    regressions = list()
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for key, threshold in (("seconds", time_threshold), ("peak_bytes", memory_threshold)):
+            limit = base[key] * (1.0 + threshold)
+            if key == "seconds":
+                limit = max(base[key], MIN_COMPARED_SECONDS) * (1.0 + threshold)
+            if base[key] and result[key] > limit:
+                regressions.append({"case": name, "measure": key, "baseline": base[key], "current": result[key],
+                                    "ratio": float(result[key]) / base[key]})
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+    :param argv: list with the arguments. By default the arguments of the command line.
+    :return: Exit code, 1 if there are regressions.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the deformer weights transfer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Approximate numbers of vertices of the meshes.")
+    parser.add_argument("--shapes", nargs="+", default=["grid", "sphere"], choices=["grid", "sphere"])
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of each case, the best time is kept.")
+    parser.add_argument("--output", default=None, help="JSON file for the results.")
+    parser.add_argument("--baseline", default=None, help="JSON file with the results to compare with.")
+    parser.add_argument("--time-threshold", type=float, default=DEFAULT_TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=DEFAULT_MEMORY_THRESHOLD)
+    arguments = parser.parse_args(argv)
+
+    results = run_benchmarks(arguments.sizes, arguments.shapes, arguments.repeats, log=print)
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not arguments.baseline:
+        return 0
+
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, arguments.time_threshold, arguments.memory_threshold)
+    for regression in regressions:
+        print("{case}: {measure} {baseline:.6g} -> {current:.6g} ({ratio:.2f}x)".format(**regression))
+    print("{} regressions".format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_cache.py - Python Script
+##################################################################################
+# Description:
+# Cache of prepared source data. Preparing a source (reading its points and triangles, building its BVH and reading
+# its weight map) is the most expensive part of a transfer, and the same source is usually copied to many targets.
+#
+# The entries are stored with a fingerprint. When an entry is requested with a different fingerprint it is stale,
+# so it is dropped and created again. The least recently used entries are evicted when the memory budget is
+# exceeded.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def array_fingerprint(*arrays):
+    """
+    Returns a hash of the shape, type and content of some arrays.
+    :param arrays: numpy arrays or values convertible to numpy arrays.
+    :return: str
+    """
+    md5 = hashlib.md5()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        md5.update("{}{}".format(array.dtype.str, array.shape).encode("utf-8"))
+        md5.update(array.view(np.uint8).ravel())
+    return md5.hexdigest()
+
+
+def get_nbytes(value):
+    """
+    Returns the memory used by a cached value. Values with a nbytes attribute report their own size, tuples and
+    lists are the sum of their items.
+    :param value: Cached value.
+    :return: int
+    """
+    if isinstance(value, (tuple, list)):
+        return sum(get_nbytes(item) for item in value)
+    return int(getattr(value, "nbytes", 0))
+
+
+class SourceCache(object):
+    """
+    Least recently used cache with a memory budget.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param max_bytes: Memory budget. The least recently used entries are evicted when it is exceeded.
+        """
+        self._entries = OrderedDict()
+        self._max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        assert isinstance(value, int) and value >= 0, "The memory budget must be a positive integer"
+        self._max_bytes = value
+        self._evict()
+
+    def get(self, key, fingerprint=None):
+        """
+        Returns the value of an entry, or None if there is no entry or it is stale.
+        :param key: Key of the entry.
+        :param fingerprint: Fingerprint of the current data. If it is not the stored one the entry is dropped.
+        :return: Cached value or None.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] != fingerprint:
+            self.invalidate(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries[key] = self._entries.pop(key)
+        return entry[1]
+
+    def put(self, key, value, fingerprint=None):
+        """
+        Stores a value.
+        :param key: Key of the entry.
+        :param value: Value to store.
+        :param fingerprint: Fingerprint of the data used to create the value.
+        """
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[2]
+        nbytes = get_nbytes(value)
+        self._entries[key] = (fingerprint, value, nbytes)
+        self.nbytes += nbytes
+        self._evict()
+
+    def get_or_create(self, key, fingerprint, factory):
+        """
+        Returns the value of an entry, creating and storing it with factory if it does not exist or it is stale.
+        :param key: Key of the entry.
+        :param fingerprint: Fingerprint of the current data.
+        :param factory: Function without arguments that returns the value.
+        :return: Cached value.
+        """
+        value = self.get(key, fingerprint)
+        if value is None:
+            value = factory()
+            self.put(key, value, fingerprint)
+        return value
+
+    def invalidate(self, key=None, predicate=None):
+        """
+        Drops entries. Without arguments all the entries are dropped.
+        :param key: Key of the entry to drop.
+        :param predicate: Function that returns True for the keys to drop.
+        """
+        if key is not None:
+            keys = [key] if key in self._entries else list()
+        elif predicate is not None:
+            keys = [k for k in self._entries if predicate(k)]
+        else:
+            keys = list(self._entries)
+
+        for k in keys:
+            self.nbytes -= self._entries.pop(k)[2]
+            self.invalidations += 1
+
+    def clear(self):
+        """
+        Drops all the entries and resets the statistics.
+        """
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        """
+        Returns the statistics of the cache.
+        :return: dict
+        """
+        requests = self.hits + self.misses
+        return {"entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                }
+
+    def _evict(self):
+        """
+        Drops the least recently used entries until the memory budget is not exceeded.
+        The most recent entry is always kept, even if it does not fit in the budget.
+        """
+        while self.nbytes > self._max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.nbytes -= entry[2]
+            self.evictions += 1
+
+
+SOURCE_CACHE = SourceCache()
@@ -0,0 +1,712 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_engine.py - Python Script
+##################################################################################
+# Description:
+# Weight transfer engine. Interpolates the weight map of a source surface into the points of a target geometry.
+#
+# The engine only works with numpy arrays and does not depend on Maya, so it can be used and tested outside Maya.
+# The source surface is stored as a point array and a triangle array and it is indexed with a bounding volume
+# hierarchy (BVH) to find the closest point of the surface for each target point.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer
+
+import numpy as np
+
+from jlr_copy_deformer_weights_weightmap import WeightMap
+
+SURFACE_ASSOCIATIONS = ("closestPoint", "rayCast", "closestComponent")
+
+_MORTON_BITS = 10
+_MORTON_WINDOW = 4
+
+
+class Cancelled(Exception):
+    """
+    Raised by the progress callbacks to stop a computation.
+    """
+
+
+def closest_point_on_triangles(points, a, b, c):
+    """
+    Returns the barycentric coordinates of the closest point of each triangle to each point.
+    All the arrays have the same length, the point i is tested against the triangle (a[i], b[i], c[i]).
+    :param points: (n, 3) array with the query points.
+    :param a: (n, 3) array with the first vertex of the triangles.
+    :param b: (n, 3) array with the second vertex of the triangles.
+    :param c: (n, 3) array with the third vertex of the triangles.
+    :return: (n, 3) array with the barycentric coordinates.
+    """
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+
+    d1 = np.einsum("ij,ij->i", ab, ap)
+    d2 = np.einsum("ij,ij->i", ac, ap)
+    d3 = np.einsum("ij,ij->i", ab, bp)
+    d4 = np.einsum("ij,ij->i", ac, bp)
+    d5 = np.einsum("ij,ij->i", ab, cp)
+    d6 = np.einsum("ij,ij->i", ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = va + vb + vc
+        v = vb / denom
+        w = vc / denom
+        bary = np.stack([1.0 - v - w, v, w], axis=1)
+
+        # The regions are applied from the lowest to the highest priority, so the vertex regions win.
+        region = (va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0)
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        bary[region] = np.stack([np.zeros_like(t), 1.0 - t, t], axis=1)[region]
+
+        region = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        t = d2 / (d2 - d6)
+        bary[region] = np.stack([1.0 - t, np.zeros_like(t), t], axis=1)[region]
+
+        region = (d6 >= 0) & (d5 <= d6)
+        bary[region] = (0.0, 0.0, 1.0)
+
+        region = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        t = d1 / (d1 - d3)
+        bary[region] = np.stack([1.0 - t, t, np.zeros_like(t)], axis=1)[region]
+
+        region = (d3 >= 0) & (d4 <= d3)
+        bary[region] = (0.0, 1.0, 0.0)
+
+        region = (d1 <= 0) & (d2 <= 0)
+        bary[region] = (1.0, 0.0, 0.0)
+
+    # Degenerated triangles can not be solved, they are collapsed to their first vertex.
+    bary[~np.isfinite(bary).all(axis=1)] = (1.0, 0.0, 0.0)
+    return bary
+
+
+def ray_triangle_intersections(origins, directions, a, b, c):
+    """
+    Returns the distance along each ray to each triangle, using the Moller-Trumbore algorithm.
+    All the arrays have the same length, the ray i is tested against the triangle (a[i], b[i], c[i]). The rays are
+    infinite lines, so the distances can be negative.
+    :param origins: (n, 3) array with the origins of the rays.
+    :param directions: (n, 3) array with the directions of the rays.
+    :param a: (n, 3) array with the first vertex of the triangles.
+    :param b: (n, 3) array with the second vertex of the triangles.
+    :param c: (n, 3) array with the third vertex of the triangles.
+    :return: tuple with an (n,) array of distances, nan if the ray does not hit the triangle, and an (n, 3) array
+    with the barycentric coordinates of the hits.
+    """
+    edge_1 = b - a
+    edge_2 = c - a
+    p_vector = np.cross(directions, edge_2)
+    determinant = np.einsum("ij,ij->i", edge_1, p_vector)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1.0 / determinant
+        t_vector = origins - a
+        u = np.einsum("ij,ij->i", t_vector, p_vector) * inverse
+        q_vector = np.cross(t_vector, edge_1)
+        v = np.einsum("ij,ij->i", directions, q_vector) * inverse
+        distances = np.einsum("ij,ij->i", edge_2, q_vector) * inverse
+
+        tolerance = 1e-7
+        hit = (np.abs(determinant) > 1e-15) & (u >= -tolerance) & (v >= -tolerance) & (u + v <= 1.0 + tolerance)
+        distances = np.where(hit, distances, np.nan)
+        u = np.clip(u, 0.0, 1.0)
+        v = np.clip(v, 0.0, 1.0 - u)
+    return distances, np.stack([1.0 - u - v, u, v], axis=1)
+
+
+def vertex_normals(points, triangles):
+    """
+    Returns the area weighted normals of the vertices of a triangle mesh.
+    :param points: (n, 3) array with the positions of the vertices.
+    :param triangles: (m, 3) array with the vertex indices of the triangles.
+    :return: (n, 3) array with unit normals. Vertices without triangles get zero normals.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    corners = points[triangles]
+    face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+    normals = np.zeros_like(points)
+    for column in range(3):
+        normals += np.stack([np.bincount(triangles[:, column], face_normals[:, axis], minlength=len(points))
+                             for axis in range(3)], axis=1)
+    length = np.linalg.norm(normals, axis=1)
+    return np.where(length[:, None] > 0, normals / np.maximum(length, 1e-300)[:, None], 0.0)
+
+
+def subset_triangles(triangles, vertex_indices):
+    """
+    Returns the triangles with all their vertices in a list of vertices.
+    :param triangles: (m, 3) array with the vertex indices of the triangles.
+    :param vertex_indices: int array with the vertex indices.
+    :return: (k, 3) array.
+    """
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    return triangles[np.isin(triangles, vertex_indices).all(axis=1)]
+
+
+def morton_codes(points, lower, upper):
+    """
+    Returns the Morton code of each point inside the box defined by lower and upper.
+    :param points: (n, 3) array.
+    :param lower: (3,) array with the minimum corner of the box.
+    :param upper: (3,) array with the maximum corner of the box.
+    :return: (n,) int64 array.
+    """
+    # The same scale is used in all the axes, so flat boxes do not collapse the codes of the points around them.
+    size = max(float(np.max(upper - lower)), 1e-12)
+    grid = (points - lower) / size * ((1 << _MORTON_BITS) - 1)
+    grid = np.clip(grid, 0, (1 << _MORTON_BITS) - 1).astype(np.int64)
+
+    codes = np.zeros(len(points), dtype=np.int64)
+    for axis in range(3):
+        value = grid[:, axis]
+        value = (value | (value << 16)) & 0x030000FF
+        value = (value | (value << 8)) & 0x0300F00F
+        value = (value | (value << 4)) & 0x030C30C3
+        value = (value | (value << 2)) & 0x09249249
+        codes |= value << (2 - axis)
+    return codes
+
+
+def box_distance2(points, lower, upper):
+    """
+    Returns the squared distances between the points and the boxes.
+    :param points: (n, 3) array.
+    :param lower: (n, 3) array with the minimum corner of the boxes.
+    :param upper: (n, 3) array with the maximum corner of the boxes.
+    :return: (n,) array.
+    """
+    delta = np.maximum(np.maximum(lower - points, points - upper), 0.0)
+    return np.einsum("ij,ij->i", delta, delta)
+
+
+def box_max_distance2(points, lower, upper):
+    """
+    Returns the squared distances between the points and the farthest corner of the boxes.
+    :param points: (n, 3) array.
+    :param lower: (n, 3) array with the minimum corner of the boxes.
+    :param upper: (n, 3) array with the maximum corner of the boxes.
+    :return: (n,) array.
+    """
+    delta = np.maximum(np.abs(points - lower), np.abs(points - upper))
+    return np.einsum("ij,ij->i", delta, delta)
+
+
+def _first_of_groups(keys):
+    """
+    Returns the positions where a new group starts in an array of sorted keys.
+    """
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+
+
+class BVH(object):
+    """
+    Bounding volume hierarchy over a list of primitives defined by their bounding boxes.
+
+    The primitives are sorted along a Morton curve and grouped in leaves of leaf_size primitives. The tree is a
+    complete binary tree stored as a heap, so the children of the node i are the nodes 2i+1 and 2i+2.
+    """
+
+    def __init__(self, lower, upper, leaf_size=8):
+        """
+        :param lower: (n, 3) array with the minimum corner of each primitive.
+        :param upper: (n, 3) array with the maximum corner of each primitive.
+        :param leaf_size: Maximum number of primitives of each leaf.
+        """
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        assert len(lower), "The BVH needs at least one primitive"
+
+        self.leaf_size = leaf_size
+        self.scene_lower = lower.min(axis=0)
+        self.scene_upper = upper.max(axis=0)
+
+        centroids = (lower + upper) * 0.5
+        codes = morton_codes(centroids, self.scene_lower, self.scene_upper)
+        self.order = np.argsort(codes, kind="stable")
+        self.sorted_codes = codes[self.order]
+
+        n_leaves = -(-len(lower) // leaf_size)
+        self.depth = int(np.ceil(np.log2(n_leaves))) if n_leaves > 1 else 0
+        self.n_leaves = 1 << self.depth
+        self.first_leaf = self.n_leaves - 1
+
+        items = np.full(self.n_leaves * leaf_size, -1, dtype=np.int64)
+        items[:len(self.order)] = self.order
+        self.leaf_items = items.reshape(self.n_leaves, leaf_size)
+
+        n_nodes = 2 * self.n_leaves - 1
+        self.lower = np.full((n_nodes, 3), np.inf)
+        self.upper = np.full((n_nodes, 3), -np.inf)
+
+        valid = self.leaf_items >= 0
+        item_lower = np.where(valid[..., None], lower[self.leaf_items], np.inf)
+        item_upper = np.where(valid[..., None], upper[self.leaf_items], -np.inf)
+        self.lower[self.first_leaf:] = item_lower.min(axis=1)
+        self.upper[self.first_leaf:] = item_upper.max(axis=1)
+
+        for level in range(self.depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (1 << (level + 1)) - 1)
+            self.lower[nodes] = np.minimum(self.lower[2 * nodes + 1], self.lower[2 * nodes + 2])
+            self.upper[nodes] = np.maximum(self.upper[2 * nodes + 1], self.upper[2 * nodes + 2])
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the arrays of the BVH.
+        """
+        return (self.order.nbytes + self.sorted_codes.nbytes + self.leaf_items.nbytes + self.lower.nbytes +
+                self.upper.nbytes)
+
+    def nearest(self, points, distance2_function):
+        """
+        Finds the closest primitive to each point.
+        :param points: (n, 3) array with the query points.
+        :param distance2_function: function(query_ids, primitive_ids) that returns the squared distances between
+        the points and the primitives.
+        :return: tuple with an (n,) array of primitive ids and an (n,) array of squared distances.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        bound = self._upper_bound(points, distance2_function)
+
+        query_ids = np.arange(len(points))
+        node_ids = np.zeros(len(points), dtype=np.int64)
+        for _ in range(self.depth + 1):
+            node_points = points[query_ids]
+            node_lower = self.lower[node_ids]
+            node_upper = self.upper[node_ids]
+
+            # Any primitive inside a box is closer than the farthest corner of the box, that tightens the bound.
+            far = box_max_distance2(node_points, node_lower, node_upper)
+            starts = _first_of_groups(query_ids)
+            if len(starts):
+                bound[query_ids[starts]] = np.minimum(bound[query_ids[starts]], np.minimum.reduceat(far, starts))
+
+            keep = box_distance2(node_points, node_lower, node_upper) <= bound[query_ids]
+            query_ids, node_ids = self._next_level(query_ids[keep], node_ids[keep])
+
+        query_ids, primitive_ids = self._leaf_primitives(query_ids, node_ids)
+        distances = distance2_function(query_ids, primitive_ids)
+        return self._reduce_min(query_ids, primitive_ids, distances, len(points))
+
+    def intersect(self, origins, directions, max_distances, distance_function):
+        """
+        Finds the primitive hit by each ray closest to the origin of the ray, in both directions.
+        :param origins: (n, 3) array with the origins of the rays.
+        :param directions: (n, 3) array with the directions of the rays.
+        :param max_distances: (n,) array with the maximum distance of each ray in both directions.
+        :param distance_function: function(ray_ids, primitive_ids) that returns the signed distances along the rays
+        to the primitives, nan if the ray does not hit the primitive.
+        :return: tuple with an (n,) array of primitive ids and an (n,) array of signed distances, inf if the ray
+        does not hit any primitive.
+        """
+        origins = np.asarray(origins, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64)
+        inverse = 1.0 / np.where(np.abs(directions) < 1e-12, 1e-12, directions)
+
+        ray_ids = np.arange(len(origins))
+        node_ids = np.zeros(len(origins), dtype=np.int64)
+        for _ in range(self.depth + 1):
+            node_lower = self.lower[node_ids]
+            node_upper = self.upper[node_ids]
+            t_1 = (node_lower - origins[ray_ids]) * inverse[ray_ids]
+            t_2 = (node_upper - origins[ray_ids]) * inverse[ray_ids]
+            t_near = np.minimum(t_1, t_2).max(axis=1)
+            t_far = np.maximum(t_1, t_2).min(axis=1)
+            limit = max_distances[ray_ids]
+
+            keep = (node_lower[:, 0] <= node_upper[:, 0]) & (t_near <= t_far) & (t_far >= -limit) & (t_near <= limit)
+            ray_ids, node_ids = self._next_level(ray_ids[keep], node_ids[keep])
+
+        ray_ids, primitive_ids = self._leaf_primitives(ray_ids, node_ids)
+        distances = distance_function(ray_ids, primitive_ids)
+        valid = np.abs(distances) <= max_distances[ray_ids]
+        ray_ids, primitive_ids, distances = ray_ids[valid], primitive_ids[valid], distances[valid]
+
+        hit_ids, hit_distances = self._reduce_min(ray_ids, primitive_ids, np.abs(distances), len(origins))
+        hit = np.flatnonzero(np.isfinite(hit_distances))
+        hit_distances[hit] = distance_function(hit, hit_ids[hit])
+        return hit_ids, hit_distances
+
+    def _next_level(self, query_ids, node_ids):
+        """
+        Replaces each internal node by its two children. The leaves are not changed.
+        """
+        if not node_ids.size or node_ids[0] >= self.first_leaf:
+            return query_ids, node_ids
+        return np.repeat(query_ids, 2), (node_ids[:, None] * 2 + np.array([1, 2])).ravel()
+
+    def _leaf_primitives(self, query_ids, node_ids):
+        """
+        Replaces each leaf by its primitives.
+        """
+        primitive_ids = self.leaf_items[node_ids - self.first_leaf].ravel()
+        query_ids = np.repeat(query_ids, self.leaf_size)
+        valid = primitive_ids >= 0
+        return query_ids[valid], primitive_ids[valid]
+
+    @staticmethod
+    def _reduce_min(query_ids, primitive_ids, values, n_queries):
+        """
+        Returns the primitive with the minimum value of each query, inf for the queries without primitives.
+        """
+        order = np.lexsort((values, query_ids))
+        first = order[_first_of_groups(query_ids[order])]
+
+        nearest_ids = np.zeros(n_queries, dtype=np.int64)
+        nearest_values = np.full(n_queries, np.inf)
+        nearest_ids[query_ids[first]] = primitive_ids[first]
+        nearest_values[query_ids[first]] = values[first]
+        return nearest_ids, nearest_values
+
+    def _upper_bound(self, points, distance2_function):
+        """
+        Returns an upper bound of the squared distance to the closest primitive of each point.
+        Each point goes down the tree choosing the closest child until it reaches a leaf, and the primitives of
+        that leaf and the primitives next to the point along the Morton curve are tested.
+        """
+        n_points = len(points)
+        node_ids = np.zeros(n_points, dtype=np.int64)
+        for _ in range(self.depth):
+            left = node_ids * 2 + 1
+            right = left + 1
+            left_distance = box_distance2(points, self.lower[left], self.upper[left])
+            right_distance = box_distance2(points, self.lower[right], self.upper[right])
+            node_ids = np.where(left_distance <= right_distance, left, right)
+        leaf_items = self.leaf_items[node_ids - self.first_leaf]
+
+        codes = morton_codes(np.clip(points, self.scene_lower, self.scene_upper), self.scene_lower, self.scene_upper)
+        position = np.searchsorted(self.sorted_codes, codes)
+        offsets = np.arange(-_MORTON_WINDOW, _MORTON_WINDOW)
+        window = self.order[np.clip(position[:, None] + offsets[None, :], 0, len(self.order) - 1)]
+
+        candidates = np.concatenate([leaf_items, window], axis=1)
+        candidates = np.where(candidates >= 0, candidates, window[:, :1])
+        query_ids = np.repeat(np.arange(n_points), candidates.shape[1])
+        distances = distance2_function(query_ids, candidates.ravel())
+        return distances.reshape(n_points, -1).min(axis=1) * (1.0 + 1e-9) + 1e-18
+
+
+class SourceSurface(object):
+    """
+    Source surface of a transfer: points, triangles and the BVH of the triangles.
+    """
+
+    def __init__(self, points, triangles, leaf_size=8):
+        """
+        :param points: (n, 3) array with the positions of the source vertices.
+        :param triangles: (m, 3) array with the vertex indices of the source triangles.
+        :param leaf_size: Maximum number of triangles of each leaf of the BVH.
+        """
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int64).reshape(-1, 3)
+        assert len(self.triangles), "The source surface does not have triangles"
+
+        corners = self.points[self.triangles]
+        self.bvh = BVH(corners.min(axis=1), corners.max(axis=1), leaf_size=leaf_size)
+        self.edge_length = float(np.linalg.norm(corners[:, 1] - corners[:, 0], axis=1).mean())
+        self.diagonal = float(np.linalg.norm(self.bvh.scene_upper - self.bvh.scene_lower))
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the arrays of the surface and its BVH.
+        """
+        return self.points.nbytes + self.triangles.nbytes + self.bvh.nbytes
+
+    def _triangle_distance2(self, points):
+        def distance2(query_ids, triangle_ids):
+            corners = self.points[self.triangles[triangle_ids]]
+            query = points[query_ids]
+            bary = closest_point_on_triangles(query, corners[:, 0], corners[:, 1], corners[:, 2])
+            delta = np.einsum("ij,ijk->ik", bary, corners) - query
+            return np.einsum("ij,ij->i", delta, delta)
+        return distance2
+
+    def closest_points(self, points):
+        """
+        Finds the closest point of the surface to each point.
+        :param points: (n, 3) array with the query points.
+        :return: tuple with an (n,) array of triangle ids and an (n, 3) array of barycentric coordinates.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        triangle_ids, _ = self.bvh.nearest(points, self._triangle_distance2(points))
+        corners = self.points[self.triangles[triangle_ids]]
+        bary = closest_point_on_triangles(points, corners[:, 0], corners[:, 1], corners[:, 2])
+        return triangle_ids, bary
+
+    def _triangle_distance(self, origins, directions):
+        def distance(ray_ids, triangle_ids):
+            corners = self.points[self.triangles[triangle_ids]]
+            distances, _ = ray_triangle_intersections(origins[ray_ids], directions[ray_ids],
+                                                      corners[:, 0], corners[:, 1], corners[:, 2])
+            return distances
+        return distance
+
+    def raycast(self, origins, directions, max_distance=None):
+        """
+        Finds the closest hit of each ray with the surface, looking in both directions of the ray.
+        The rays are tested with a short distance first and the distance grows for the rays without hits, so the
+        rays that hit near their origin do not walk all the BVH.
+        :param origins: (n, 3) array with the origins of the rays.
+        :param directions: (n, 3) array with the directions of the rays.
+        :param max_distance: Maximum distance of the hits. By default the diagonal of the surface bounding box.
+        :return: tuple with an (n,) array of triangle ids, an (n, 3) array of barycentric coordinates and an (n,)
+        bool array with the rays that hit the surface.
+        """
+        origins = np.asarray(origins, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64)
+        max_distance = self.diagonal if max_distance is None else float(max_distance)
+
+        triangle_ids = np.zeros(len(origins), dtype=np.int64)
+        bary = np.zeros((len(origins), 3))
+        hit = np.zeros(len(origins), dtype=bool)
+
+        pending = np.flatnonzero(np.linalg.norm(directions, axis=1) > 0)
+        distance = min(max(self.edge_length, 1e-9) * 2.0, max_distance)
+        while len(pending):
+            pending_origins = origins[pending]
+            pending_directions = directions[pending]
+            ids, distances = self.bvh.intersect(pending_origins, pending_directions,
+                                                np.full(len(pending), distance),
+                                                self._triangle_distance(pending_origins, pending_directions))
+            found = np.isfinite(distances)
+            corners = self.points[self.triangles[ids[found]]]
+            _, bary[pending[found]] = ray_triangle_intersections(pending_origins[found], pending_directions[found],
+                                                                 corners[:, 0], corners[:, 1], corners[:, 2])
+            triangle_ids[pending[found]] = ids[found]
+            hit[pending[found]] = True
+
+            pending = pending[~found]
+            if distance >= max_distance:
+                break
+            distance = min(distance * 4.0, max_distance)
+
+        return triangle_ids, bary, hit
+
+
+class Correspondence(object):
+    """
+    Maps a source weight map into a target geometry.
+    Each target point stores the source vertex indices that define it and the interpolation weights of them.
+    """
+
+    def __init__(self, indices, weights):
+        """
+        :param indices: (n, k) int array with the source vertex indices of each target point.
+        :param weights: (n, k) float array with the interpolation weights of the source vertices.
+        """
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self._reverse_index = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the stored arrays.
+        """
+        nbytes = self.indices.nbytes + self.weights.nbytes
+        if self._reverse_index is not None:
+            nbytes += self._reverse_index[0].nbytes + self._reverse_index[1].nbytes
+        return nbytes
+
+    def reverse_index(self):
+        """
+        Returns the target points that use each source vertex with a weight that is not zero, in CSR form.
+        It is built the first time it is requested.
+        :return: tuple with an (n_source + 1,) int64 array of offsets and an int32 array of target points. The
+        target points of the source vertex i are points[offsets[i]:offsets[i + 1]].
+        """
+        if self._reverse_index is None:
+            used = self.weights.ravel() != 0
+            sources = self.indices.ravel()[used]
+            points = np.repeat(np.arange(len(self), dtype=np.int32), self.indices.shape[1])[used]
+            order = np.argsort(sources, kind="stable")
+            counts = np.bincount(sources, minlength=int(sources.max()) + 1 if len(sources) else 0)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            self._reverse_index = (offsets, points[order])
+        return self._reverse_index
+
+    def affected_points(self, source_indices):
+        """
+        Returns the target points whose weights depend on some source vertices.
+        The cost depends on the number of source vertices and of affected points, not on the size of the geometries.
+        :param source_indices: (n,) int array with source vertex indices.
+        :return: sorted int32 array with target point indices.
+        """
+        offsets, points = self.reverse_index()
+        source_indices = np.asarray(source_indices, dtype=np.int64).ravel()
+        source_indices = source_indices[source_indices < len(offsets) - 1]
+        starts = offsets[source_indices]
+        counts = offsets[source_indices + 1] - starts
+        # Positions of all the ranges points[start:start + count] without a loop.
+        positions = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return np.unique(points[positions])
+
+    def apply_points(self, source_weights, points):
+        """
+        Interpolates the source weights into some target points.
+        :param source_weights: WeightMap of the source geometry.
+        :param points: (n,) int array with target point indices.
+        :return: (n,) float32 array.
+        """
+        points = np.asarray(points, dtype=np.int64).ravel()
+        return (source_weights.get(self.indices[points]) * self.weights[points]).sum(axis=1, dtype=np.float32)
+
+    def apply(self, source_weights):
+        """
+        Interpolates the source weights into the target points.
+        :param source_weights: (..., n_source) array or WeightMap. Several weight maps can be interpolated at the
+        same time passing a 2D array.
+        :return: (..., n_target) float32 array, or a WeightMap if source_weights is a WeightMap.
+        """
+        if isinstance(source_weights, WeightMap):
+            return self.apply_weight_map(source_weights)
+        # The columns are gathered one by one to not build an (..., n_target, k) array with many weight maps.
+        source_weights = np.asarray(source_weights, dtype=np.float32)
+        result = source_weights[..., self.indices[:, 0]] * self.weights[:, 0]
+        for column in range(1, self.indices.shape[1]):
+            result += source_weights[..., self.indices[:, column]] * self.weights[:, column]
+        return result
+
+    def apply_weight_map(self, weight_map):
+        """
+        Interpolates a sparse source weight map into the target points.
+        Only the target points that use a stored source point are stored in the result, the rest of the points get
+        the default value of the source weight map.
+        :param weight_map: WeightMap of the source geometry.
+        :return: WeightMap of the target geometry.
+        """
+        touched = np.flatnonzero(np.isin(self.indices, weight_map.indices).any(axis=1))
+        values = (weight_map.get(self.indices[touched]) * self.weights[touched]).sum(axis=1)
+        result = WeightMap(len(self), touched, values, default=weight_map.default)
+        return result.sparsify()
+
+
+def compute_correspondence(source, target_points, surface_association="closestPoint", chunk_size=4096,
+                           target_normals=None, max_distance=None, progress=None):
+    """
+    Computes the correspondence between the target points and the source surface.
+    :param source: SourceSurface
+    :param target_points: (n, 3) array with the positions of the target points.
+    :param surface_association: closestPoint, rayCast or closestComponent.
+    :param chunk_size: Number of target points solved at the same time.
+    :param target_normals: (n, 3) array with the normals of the target points, used by rayCast. The points without
+    normals, or all of them if there are no normals, use closestPoint.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint.
+    :param progress: Function called after each chunk with the number of solved points and the number of points.
+    It can raise Cancelled to stop the computation.
+    :return: Correspondence
+    """
+    assert surface_association in SURFACE_ASSOCIATIONS, \
+        "Surface association must be one of {}".format(", ".join(SURFACE_ASSOCIATIONS))
+
+    target_points = np.asarray(target_points, dtype=np.float64).reshape(-1, 3)
+    if target_normals is not None:
+        target_normals = np.asarray(target_normals, dtype=np.float64).reshape(-1, 3)
+    indices = np.zeros((len(target_points), 3), dtype=np.int32)
+    weights = np.zeros((len(target_points), 3), dtype=np.float32)
+
+    for start in range(0, len(target_points), chunk_size):
+        chunk = target_points[start:start + chunk_size]
+
+        if surface_association == "rayCast" and target_normals is not None:
+            triangle_ids, bary, hit = source.raycast(chunk, target_normals[start:start + chunk_size], max_distance)
+            if not hit.all():
+                triangle_ids[~hit], bary[~hit] = source.closest_points(chunk[~hit])
+        else:
+            triangle_ids, bary = source.closest_points(chunk)
+        chunk_indices = source.triangles[triangle_ids]
+
+        if surface_association == "closestComponent":
+            delta = source.points[chunk_indices] - chunk[:, None, :]
+            closest = np.einsum("ijk,ijk->ij", delta, delta).argmin(axis=1)
+            bary = np.zeros_like(bary)
+            bary[np.arange(len(chunk)), closest] = 1.0
+
+        indices[start:start + chunk_size] = chunk_indices
+        weights[start:start + chunk_size] = bary
+        if progress:
+            progress(start + len(chunk), len(target_points))
+
+    return Correspondence(indices, weights)
+
+
+def transfer_weights(source_points, source_triangles, source_weights, target_points,
+                     surface_association="closestPoint", target_normals=None):
+    """
+    Interpolates a source weight map into the target points.
+    :param source_points: (n, 3) array with the positions of the source vertices.
+    :param source_triangles: (m, 3) array with the vertex indices of the source triangles.
+    :param source_weights: (n,) array or WeightMap with the source weight map.
+    :param target_points: (t, 3) array with the positions of the target points.
+    :param surface_association: closestPoint, rayCast or closestComponent.
+    :param target_normals: (t, 3) array with the normals of the target points, used by rayCast.
+    :return: (t,) float32 array or WeightMap with the target weight map.
+    """
+    source = SourceSurface(source_points, source_triangles)
+    correspondence = compute_correspondence(source, target_points, surface_association,
+                                            target_normals=target_normals)
+    return correspondence.apply(source_weights)
+
+
+def transfer_batch(source, source_weights, targets_points, surface_association="closestPoint", max_workers=None,
+                   targets_normals=None, progress=None, max_distance=None):
+    """
+    Interpolates a source weight map into several targets at the same time.
+    The targets are solved in a thread pool. The source is shared by all the threads because the BVH is only read,
+    and numpy releases the GIL in the heavy operations.
+    :param source: SourceSurface
+    :param source_weights: (n,) array or WeightMap with the source weight map.
+    :param targets_points: list of (t, 3) arrays with the positions of the points of each target.
+    :param surface_association: closestPoint, rayCast or closestComponent.
+    :param max_workers: Maximum number of threads. By default the number of processors.
+    :param targets_normals: list with the (t, 3) normals of each target, or None, used by rayCast.
+    :param progress: Function called with the number of solved points of all the targets and the total number of
+    points. It can raise Cancelled to stop the computation.
+    :param max_distance: Maximum distance of the rayCast hits. The points without hits use closestPoint.
+    :return: list with a tuple (target weights, seconds) for each target, in the same order as targets_points.
+    """
+    targets_normals = [None] * len(targets_points) if targets_normals is None else targets_normals
+    total = sum(len(points) for points in targets_points)
+    solved = [0]
+    lock = threading.Lock()
+
+    def solve(target):
+        start = default_timer()
+        target_solved = [0]
+
+        def target_progress(done, _):
+            with lock:
+                solved[0] += done - target_solved[0]
+                target_solved[0] = done
+                current = solved[0]
+            progress(current, total)
+
+        correspondence = compute_correspondence(source, target[0], surface_association, target_normals=target[1],
+                                                max_distance=max_distance,
+                                                progress=target_progress if progress else None)
+        return correspondence.apply(source_weights), default_timer() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(solve, zip(targets_points, targets_normals)))
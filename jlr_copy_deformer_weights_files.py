@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_files.py - Python Script
+##################################################################################
+# Description:
+# Binary files of numpy arrays. A file stores a JSON header with metadata and the description of its arrays,
+# followed by the raw data of each array aligned to 64 bytes, so the arrays can be memory mapped and only the
+# arrays that are used are read from the disk.
+#
+# The correspondence files store the mapping between a source and a target geometry, so transfers between the same
+# geometries can replay it instead of computing it again.
+# The weight map files store sparse weight maps with the points and the triangles of their geometries, so the maps
+# can be transferred in other scenes without their source geometries.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import json
+import struct
+
+import numpy as np
+
+import jlr_copy_deformer_weights_engine as engine
+from jlr_copy_deformer_weights_weightmap import WeightMap
+
+MAGIC = b"CDWARRAY"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_arrays(path, arrays, metadata=None):
+    """
+    Writes some arrays into a file.
+    :param path: File path.
+    :param arrays: dict with the arrays by name.
+    :param metadata: dict with values that can be stored as JSON.
+    """
+    arrays = dict((name, np.ascontiguousarray(array)) for name, array in arrays.items())
+    names = sorted(arrays)
+
+    # The offsets are relative to the end of the header, so they do not depend on the header length.
+    descriptions = dict()
+    offset = 0
+    for name in names:
+        descriptions[name] = {"dtype": arrays[name].dtype.str, "shape": list(arrays[name].shape), "offset": offset}
+        offset = _align(offset + arrays[name].nbytes)
+
+    header = json.dumps({"metadata": metadata or dict(), "arrays": descriptions}, sort_keys=True).encode("utf-8")
+    header += b" " * (_align(_PREAMBLE.size + len(header)) - _PREAMBLE.size - len(header))
+
+    with open(path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        data_start = f.tell()
+        for name in names:
+            f.seek(data_start + descriptions[name]["offset"])
+            f.write(arrays[name].tobytes())
+
+
+class ArrayFile(object):
+    """
+    File written by write_arrays. The header is read when the file is opened and each array is read the first time
+    it is requested.
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        :param path: File path.
+        :param mmap: Memory maps the arrays instead of reading them.
+        """
+        self.path = path
+        self.mmap = mmap
+        self._arrays = dict()
+
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) != _PREAMBLE.size:
+                raise ValueError("{} is not a weights file".format(path))
+            magic, version, header_length = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise ValueError("{} is not a weights file".format(path))
+            if version > FORMAT_VERSION:
+                raise ValueError("{} was written with a newer version ({}) of the format".format(path, version))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        self.version = version
+        self.metadata = header["metadata"]
+        self.descriptions = header["arrays"]
+        self._data_start = _PREAMBLE.size + header_length
+
+    def __contains__(self, name):
+        return name in self.descriptions
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = self._read(self.descriptions[name])
+        return self._arrays[name]
+
+    @property
+    def names(self):
+        """
+        Names of the stored arrays.
+        """
+        return sorted(self.descriptions)
+
+    def _read(self, description):
+        dtype = np.dtype(description["dtype"])
+        shape = tuple(description["shape"])
+        offset = self._data_start + description["offset"]
+        count = int(np.prod(shape)) if shape else 1
+        if self.mmap and count:
+            return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+
+
+def save_correspondence(path, correspondence, key):
+    """
+    Writes a correspondence file.
+    :param path: File path.
+    :param correspondence: Correspondence
+    :param key: dict with the strings that identify the data used to compute the correspondence.
+    """
+    write_arrays(path, {"indices": correspondence.indices, "weights": correspondence.weights},
+                 {"type": "correspondence", "key": key})
+
+
+def load_correspondence(path, key, mmap=True):
+    """
+    Reads a correspondence file.
+    :param path: File path.
+    :param key: dict with the strings that identify the data of the current transfer.
+    :param mmap: Memory maps the arrays instead of reading them.
+    :return: Correspondence, or None if the file does not exist, it is not valid or it is stale.
+    """
+    try:
+        array_file = ArrayFile(path, mmap)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if array_file.metadata.get("type") != "correspondence" or array_file.metadata.get("key") != key:
+        return None
+    return engine.Correspondence(array_file["indices"], array_file["weights"])
+
+
+def write_weight_archive(path, geometries, weight_maps):
+    """
+    Writes several weight maps into a file, with the points and the triangles of their geometries so they can be
+    transferred to other geometries without the source geometries.
+    :param path: File path.
+    :param geometries: dict with tuples (points, triangles) by geometry name.
+    :param weight_maps: list of tuples (map name, geometry name, WeightMap).
+    """
+    arrays = dict()
+    geometry_descriptions = list()
+    for index, name in enumerate(sorted(geometries)):
+        points, triangles = geometries[name]
+        arrays["geometry{}.points".format(index)] = np.asarray(points, dtype=np.float64)
+        arrays["geometry{}.triangles".format(index)] = np.asarray(triangles, dtype=np.int32).reshape(-1, 3)
+        geometry_descriptions.append({"name": name, "array": "geometry{}".format(index), "size": len(points)})
+
+    map_descriptions = list()
+    for index, (name, geometry, weight_map) in enumerate(weight_maps):
+        assert geometry in geometries, "The geometry {} of the map {} is not in the file".format(geometry, name)
+        assert len(weight_map) == len(geometries[geometry][0]), \
+            "The map {} does not have a weight for each point of {}".format(name, geometry)
+        arrays["map{}.indices".format(index)] = weight_map.indices
+        arrays["map{}.values".format(index)] = weight_map.values
+        map_descriptions.append({"name": name, "geometry": geometry, "array": "map{}".format(index),
+                                 "size": len(weight_map), "default": weight_map.default})
+
+    write_arrays(path, arrays, {"type": "weights", "geometries": geometry_descriptions, "maps": map_descriptions})
+
+
+class WeightArchive(object):
+    """
+    File written by write_weight_archive. The weight maps and the geometries are read when they are requested.
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        :param path: File path.
+        :param mmap: Memory maps the arrays instead of reading them.
+        """
+        self.array_file = ArrayFile(path, mmap)
+        if self.array_file.metadata.get("type") != "weights":
+            raise ValueError("{} is not a weight map file".format(path))
+        self.geometries = self.array_file.metadata["geometries"]
+        self.maps = self.array_file.metadata["maps"]
+
+    @property
+    def geometry_names(self):
+        """
+        Names of the stored geometries.
+        """
+        return [description["name"] for description in self.geometries]
+
+    def get_map_names(self, geometry=None):
+        """
+        Returns the names of the stored weight maps.
+        :param geometry: Only returns the maps of this geometry. By default the maps of every geometry.
+        :return: list of str
+        """
+        return [description["name"] for description in self.maps
+                if geometry is None or description["geometry"] == geometry]
+
+    def get_map_description(self, name, geometry=None):
+        """
+        Returns the description of a stored weight map.
+        :param name: Name of the map.
+        :param geometry: Geometry of the map. It can be omitted if only one geometry has a map with that name.
+        :return: dict
+        """
+        descriptions = [description for description in self.maps
+                        if description["name"] == name and geometry in (None, description["geometry"])]
+        if not descriptions:
+            raise KeyError("There is no weight map {} in {}".format(name, self.array_file.path))
+        if len(descriptions) > 1:
+            raise KeyError("There are several weight maps {}, the geometry must be specified".format(name))
+        return descriptions[0]
+
+    def get_weight_map(self, name, geometry=None):
+        """
+        Returns a stored weight map.
+        :param name: Name of the map.
+        :param geometry: Geometry of the map. It can be omitted if only one geometry has a map with that name.
+        :return: WeightMap
+        """
+        description = self.get_map_description(name, geometry)
+        return WeightMap(description["size"],
+                         self.array_file["{}.indices".format(description["array"])],
+                         self.array_file["{}.values".format(description["array"])],
+                         default=description["default"])
+
+    def get_geometry(self, name):
+        """
+        Returns the points and the triangles of a stored geometry.
+        :param name: Name of the geometry.
+        :return: tuple with an (n, 3) float64 array and an (m, 3) int32 array.
+        """
+        for description in self.geometries:
+            if description["name"] == name:
+                return (self.array_file["{}.points".format(description["array"])],
+                        self.array_file["{}.triangles".format(description["array"])])
+        raise KeyError("There is no geometry {} in {}".format(name, self.array_file.path))
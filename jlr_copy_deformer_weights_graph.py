@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_graph.py - Python Script
+##################################################################################
+# Description:
+# Index of the deformer graph. Finding the deformers of a shape and the index of a shape in a deformer needs to walk
+# the history of the scene, which is slow in scenes with many deformers. The index keeps the results of those walks
+# until a node is removed, renamed or reconnected, and then only the entries of the affected nodes are dropped.
+#
+# The graph is accessed through the DeformerGraph interface. MayaDeformerGraph walks the Maya scene and
+# MemoryDeformerGraph is a fake graph, so the index can be tested outside Maya.
+#
+# Author: Juan Lara.
+##################################################################################
+
+try:
+    from maya import cmds
+    from maya.api import OpenMaya as om
+except ImportError:
+    cmds = om = None
+
+
+class DeformerGraph(object):
+    """
+    Interface to the deformers of a scene.
+    """
+
+    def get_key(self, node):
+        """
+        Returns a key that identifies a node. It must not change when the node is renamed.
+        :param node: Node name or PyNode.
+        :return: Hashable value.
+        """
+        raise NotImplementedError
+
+    def list_deformers(self, shape):
+        """
+        Returns the deformers in the history of a shape.
+        :param shape: Shape name or PyNode.
+        :return: list of tuples (deformer name, deformer type).
+        """
+        raise NotImplementedError
+
+    def get_geometry_indices(self, deformer):
+        """
+        Returns the shapes deformed by a deformer and their indices in the deformer.
+        :param deformer: Deformer name or PyNode.
+        :return: list of tuples (shape name, index).
+        """
+        raise NotImplementedError
+
+
+class MayaDeformerGraph(DeformerGraph):
+    """
+    Deformer graph of the Maya scene. The nodes are identified by the hash code of their MObjectHandle.
+    """
+
+    def get_key(self, node):
+        selection = om.MSelectionList()
+        selection.add(str(node))
+        return om.MObjectHandle(selection.getDependNode(0)).hashCode()
+
+    def list_deformers(self, shape):
+        history = cmds.listHistory(str(shape), historyAttr=True, interestLevel=1, pruneDagObjects=True) or list()
+        return [(node, cmds.nodeType(node)) for node in history if cmds.objectType(node, isAType="geometryFilter")]
+
+    def get_geometry_indices(self, deformer):
+        shapes = cmds.deformer(str(deformer), q=True, geometry=True) or list()
+        indices = cmds.deformer(str(deformer), q=True, geometryIndices=True) or list()
+        return list(zip(shapes, indices))
+
+
+class MemoryDeformerGraph(DeformerGraph):
+    """
+    Fake deformer graph. The nodes are identified by their names and the calls are counted.
+    """
+
+    def __init__(self):
+        self.deformers = dict()
+        self.calls = 0
+
+    def add_deformer(self, deformer, deformer_type, shapes, indices=None):
+        """
+        Adds a deformer, or replaces it.
+        :param deformer: Deformer name.
+        :param deformer_type: Node type of the deformer.
+        :param shapes: list with the names of the deformed shapes.
+        :param indices: list with the index of each shape. By default 0, 1, 2...
+        """
+        indices = range(len(shapes)) if indices is None else indices
+        self.deformers[deformer] = (deformer_type, list(zip(shapes, indices)))
+
+    def remove_deformer(self, deformer):
+        """
+        Removes a deformer.
+        :param deformer: Deformer name.
+        """
+        del self.deformers[deformer]
+
+    def get_key(self, node):
+        return str(node)
+
+    def list_deformers(self, shape):
+        self.calls += 1
+        return [(deformer, deformer_type) for deformer, (deformer_type, shapes) in self.deformers.items()
+                if str(shape) in [name for name, _ in shapes]]
+
+    def get_geometry_indices(self, deformer):
+        self.calls += 1
+        return list(self.deformers[str(deformer)][1]) if str(deformer) in self.deformers else list()
+
+
+class DeformerGraphIndex(object):
+    """
+    Cache of the deformers of each shape and of the index of each shape in each deformer.
+    """
+
+    def __init__(self, graph):
+        """
+        :param graph: DeformerGraph
+        """
+        self.graph = graph
+        self._shape_deformers = dict()
+        self._geometry_indices = dict()
+
+    def get_deformers(self, shape, types=None):
+        """
+        Returns the deformers in the history of a shape.
+        :param shape: Shape name or PyNode.
+        :param types: list of deformer types. By default all the deformers are returned.
+        :return: list of deformer names.
+        """
+        key = self.graph.get_key(shape)
+        if key not in self._shape_deformers:
+            self._shape_deformers[key] = [(deformer, deformer_type, self.graph.get_key(deformer))
+                                          for deformer, deformer_type in self.graph.list_deformers(shape)]
+        return [deformer for deformer, deformer_type, _ in self._shape_deformers[key]
+                if types is None or deformer_type in types]
+
+    def get_geometry_index(self, deformer, shape):
+        """
+        Returns the index of a shape in a deformer.
+        :param deformer: Deformer name or PyNode.
+        :param shape: Shape name or PyNode.
+        :return: int, or None if the deformer does not deform the shape.
+        """
+        key = self.graph.get_key(deformer)
+        if key not in self._geometry_indices:
+            self._geometry_indices[key] = dict((self.graph.get_key(name), index)
+                                               for name, index in self.graph.get_geometry_indices(deformer))
+        return self._geometry_indices[key].get(self.graph.get_key(shape))
+
+    def invalidate(self, node):
+        """
+        Drops the entries of a node that changed: its own entries and the deformer lists that contain it.
+        :param node: Node name or PyNode.
+        """
+        self.invalidate_key(self.graph.get_key(node))
+
+    def invalidate_key(self, key):
+        """
+        Drops the entries of a node that changed, see invalidate.
+        :param key: Key of the node.
+        """
+        self._geometry_indices.pop(key, None)
+        self._shape_deformers.pop(key, None)
+        for shape_key, deformers in list(self._shape_deformers.items()):
+            if any(deformer_key == key for _, _, deformer_key in deformers):
+                del self._shape_deformers[shape_key]
+
+    def clear(self):
+        """
+        Drops all the entries.
+        """
+        self._shape_deformers.clear()
+        self._geometry_indices.clear()
+
+
+def _node_changed(node, index):
+    if node.hasFn(om.MFn.kGeometryFilt) or node.hasFn(om.MFn.kShape):
+        index.invalidate_key(om.MObjectHandle(node).hashCode())
+
+
+def _connection_changed(source_plug, destination_plug, made, index):
+    _node_changed(source_plug.node(), index)
+    _node_changed(destination_plug.node(), index)
+
+
+def _name_changed(node, previous_name, index):
+    _node_changed(node, index)
+
+
+def _node_removed(node, index):
+    _node_changed(node, index)
+
+
+def _scene_changed(index):
+    index.clear()
+
+
+def install_callbacks(index):
+    """
+    Adds the Maya callbacks that keep an index of the Maya scene updated.
+    :param index: DeformerGraphIndex of a MayaDeformerGraph.
+    :return: list of callback ids.
+    """
+    return [om.MDGMessage.addConnectionCallback(_connection_changed, index),
+            om.MDGMessage.addNodeRemovedCallback(_node_removed, "dependNode", index),
+            om.MNodeMessage.addNameChangedCallback(om.MObject.kNullObj, _name_changed, index),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, _scene_changed, index),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, _scene_changed, index),
+            ]
+
+
+_index = None
+
+
+def get_index():
+    """
+    Returns the index of the Maya scene. It is created, with its callbacks, the first time it is requested.
+    :return: DeformerGraphIndex
+    """
+    global _index
+    if _index is None:
+        _index = DeformerGraphIndex(MayaDeformerGraph())
+        install_callbacks(_index)
+    return _index
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_incremental.py - Python Script
+##################################################################################
+# Description:
+# Incremental transfers. When a source weight map is painted and copied again and again, most of the target points
+# do not change. An IncrementalTransfer remembers the correspondence of the last transfer and the source weights it
+# used, so the next transfer only compares the source weights with that snapshot and recomputes and writes the
+# target points that use a changed source vertex, found with the reverse index of the correspondence.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import numpy as np
+
+
+class IncrementalTransfer(object):
+    """
+    Last transfer of a source weight map into a target weight map.
+    """
+
+    def __init__(self, correspondence, source_weight_map, target_indices=None, target_version=None):
+        """
+        :param correspondence: Correspondence used by the transfer.
+        :param source_weight_map: WeightMap of the source used by the transfer.
+        :param target_indices: (n,) int array with the target point of each point of the correspondence, if only
+        some target points were transferred. By default the correspondence has all the target points.
+        :param target_version: Version of the target weights after the transfer, see WeightIO.get_weights_version.
+        """
+        self.correspondence = correspondence
+        self.source_weight_map = source_weight_map
+        self.target_indices = None if target_indices is None else np.asarray(target_indices, dtype=np.int32)
+        self.target_version = target_version
+
+    def __repr__(self):
+        return "IncrementalTransfer(points={}, source={!r})".format(len(self.correspondence), self.source_weight_map)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the stored arrays.
+        """
+        nbytes = self.correspondence.nbytes + self.source_weight_map.nbytes
+        if self.target_indices is not None:
+            nbytes += self.target_indices.nbytes
+        return nbytes
+
+    def is_valid(self, source_weight_map, target_version):
+        """
+        Returns True if the transfer can be updated: the target weights were not changed since the transfer and
+        the source weight map can be compared with the snapshot.
+        :param source_weight_map: Current WeightMap of the source.
+        :param target_version: Current version of the target weights.
+        :return: bool
+        """
+        return (target_version is not None and target_version == self.target_version and
+                len(source_weight_map) == len(self.source_weight_map) and
+                source_weight_map.default == self.source_weight_map.default)
+
+    def update(self, source_weight_map):
+        """
+        Returns the target points that change with a new source weight map and their new weights, and stores the
+        new source weight map as the snapshot.
+        :param source_weight_map: Current WeightMap of the source.
+        :return: tuple with an (n,) int32 array of target point indices and an (n,) float32 array of weights.
+        """
+        changed = changed_indices(self.source_weight_map, source_weight_map)
+        points = self.correspondence.affected_points(changed)
+        values = self.correspondence.apply_points(source_weight_map, points)
+        self.source_weight_map = source_weight_map
+        if self.target_indices is not None:
+            points = self.target_indices[points]
+        return points, values
+
+
+def changed_indices(old, new):
+    """
+    Returns the points whose value is different in two weight maps of the same geometry.
+    :param old: WeightMap
+    :param new: WeightMap
+    :return: sorted int32 array with point indices.
+    """
+    assert len(old) == len(new), "The weight maps must have the same size"
+    if old is new:
+        return np.zeros(0, dtype=np.int32)
+    if old.default != new.default:
+        return np.arange(len(new), dtype=np.int32)
+    # Painting usually changes the values of the stored points without adding or removing points.
+    if np.array_equal(old.indices, new.indices):
+        return new.indices[old.values != new.values]
+    indices = np.union1d(old.indices, new.indices).astype(np.int32)
+    return indices[old.get(indices) != new.get(indices)]
@@ -0,0 +1,630 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_io.py - Python Script
+##################################################################################
+# Description:
+# Weight I/O layer. Reads and writes the whole weight list of a deformer in one call instead of setting the
+# weights one by one through PyMEL attributes.
+#
+# WeightIO is the interface used by the transfer functions. MayaWeightIO works on the Maya scene and
+# MemoryWeightIO keeps the weights in memory, so the callers can be tested and benchmarked outside Maya.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import itertools
+
+import numpy as np
+
+import jlr_copy_deformer_weights_graph as cdw_graph
+from jlr_copy_deformer_weights_undo import WeightDelta, set_plug_elements
+from jlr_copy_deformer_weights_weightmap import WeightMap, index_runs, merge_for_write
+
+try:
+    from maya import cmds
+    from maya.api import OpenMaya as om
+    from maya.api import OpenMayaAnim as oma
+except ImportError:
+    cmds = om = oma = None
+
+DEFAULT_WEIGHT = 1.0
+WEIGHT_ATTRIBUTES = ("weightList", "weights", "inputTarget", "baseWeights", "targetWeights")
+
+# Weight versions of the deformers by MObjectHandle hash code: lists [MObjectHandle, callback id, version].
+# The versions come from a single counter, so a node that reuses the hash code of a deleted node never gets the
+# version of the deleted node.
+_weight_versions = dict()
+_version_counter = itertools.count(1)
+_scene_callbacks = list()
+
+
+class SkinInfluence(object):
+    """
+    Weight map of one influence of a skinCluster. It can be used as a source deformer, but not as a target.
+    """
+
+    def __init__(self, skin_cluster, influence):
+        """
+        :param skin_cluster: skinCluster name or PyNode.
+        :param influence: Influence name or PyNode.
+        """
+        self.skin_cluster = str(skin_cluster)
+        self.influence = str(influence)
+
+    def __str__(self):
+        return "{}[{}]".format(self.skin_cluster, self.influence)
+
+    def __repr__(self):
+        return "SkinInfluence({!r}, {!r})".format(self.skin_cluster, self.influence)
+
+    def __eq__(self, other):
+        return isinstance(other, SkinInfluence) and (self.skin_cluster, self.influence) == (
+            other.skin_cluster, other.influence)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.skin_cluster, self.influence))
+
+    def find_column(self, influences):
+        """
+        Returns the column of the influence in the weight matrix of the skinCluster.
+        The influence is searched by its name and then by its short name.
+        :param influences: list with the influence names of the skinCluster, in the order of the matrix columns.
+        :return: int, or None if the influence is not in the list.
+        """
+        if self.influence in influences:
+            return influences.index(self.influence)
+        short_names = [name.split("|")[-1] for name in influences]
+        short_name = self.influence.split("|")[-1]
+        return short_names.index(short_name) if short_name in short_names else None
+
+    def get_column(self, influences):
+        """
+        Returns the column of the influence in the weight matrix of the skinCluster.
+        :param influences: list with the influence names of the skinCluster, in the order of the matrix columns.
+        :return: int
+        """
+        column = self.find_column(influences)
+        assert column is not None, "{} is not an influence of {}".format(self.influence, self.skin_cluster)
+        return column
+
+
+class BlendShapeMap(object):
+    """
+    Weight map of a blendShape: the base weights or the weights of one of its targets.
+    """
+
+    def __init__(self, blend_shape, target=None, name=None):
+        """
+        :param blend_shape: blendShape name or PyNode.
+        :param target: Index of the target, None for the base weights.
+        :param name: Name of the target (its alias). It is only used to show and match the maps.
+        """
+        self.blend_shape = str(blend_shape)
+        self.target = None if target is None else int(target)
+        self.name = name if name else ("base" if target is None else "target{}".format(target))
+
+    def __str__(self):
+        if self.target is None:
+            return "{}.baseWeights".format(self.blend_shape)
+        return "{}.targetWeights[{}]".format(self.blend_shape, self.target)
+
+    def __repr__(self):
+        return "BlendShapeMap({!r}, {!r}, {!r})".format(self.blend_shape, self.target, self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, BlendShapeMap) and (self.blend_shape, self.target) == (
+            other.blend_shape, other.target)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.blend_shape, self.target))
+
+
+class WeightIO(object):
+    """
+    Interface to read and write the weight map of a deformer for a geometry.
+
+    The implementations only need to move sparse WeightMaps, the dense versions are built on top of them.
+    Like in Maya, the points that are not stored in a weight list have the default value of the weight attribute,
+    DEFAULT_WEIGHT, so the maps are read with that default value.
+    """
+
+    # list of WeightDeltas where the writes are recorded inside undo_step, see jlr_copy_deformer_weights_undo.
+    deltas = None
+
+    # Calls to the scene and number of weights moved by them.
+    read_calls = 0
+    write_calls = 0
+    weights_read = 0
+    weights_written = 0
+
+    def read_weight_map(self, deformer, geometry):
+        """
+        Returns the stored weight map of the deformer for the geometry.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: WeightMap
+        """
+        raise NotImplementedError
+
+    def write_weight_map(self, deformer, geometry, weight_map):
+        """
+        Sets the weight map of the deformer for the geometry. Only the points whose value changes are written.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :param weight_map: WeightMap
+        """
+        raise NotImplementedError
+
+    def has_weights(self, deformer, geometry):
+        """
+        Returns True if the deformer has a weight map for the geometry.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: bool
+        """
+        raise NotImplementedError
+
+    def read_skin_weights(self, skin_cluster, geometry):
+        """
+        Returns the full weight matrix of a skinCluster for a geometry.
+        :param skin_cluster: skinCluster name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: tuple with an (n_points, n_influences) float32 array and the list of influence names.
+        """
+        raise NotImplementedError
+
+    def list_blend_shape_maps(self, blend_shape):
+        """
+        Returns the weight maps of a blendShape: the base weights and the weights of each target.
+        :param blend_shape: blendShape name or PyNode.
+        :return: list of BlendShapeMap
+        """
+        raise NotImplementedError
+
+    def read_influence_weight_map(self, influence, geometry):
+        """
+        Returns the weight map of one influence of a skinCluster, slicing its weight matrix.
+        :param influence: SkinInfluence
+        :param geometry: Geometry name or PyNode.
+        :return: WeightMap
+        """
+        matrix, influences = self.read_skin_weights(influence.skin_cluster, geometry)
+        return WeightMap.from_dense(matrix[:, influence.get_column(influences)])
+
+    def write_weight_values(self, deformer, geometry, indices, values):
+        """
+        Sets the weights of some points of the geometry, the rest of the points do not change.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :param indices: (n,) int array with the point indices.
+        :param values: (n,) array with the weights.
+        """
+        self.write_weight_map(deformer, geometry, self.read_weight_map(deformer, geometry).update(indices, values))
+
+    def get_weights_version(self, deformer, geometry):
+        """
+        Returns a token that changes every time the weight map of the deformer for the geometry changes.
+        It is used to know if a cached copy of the weight map is still valid.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: hashable value, or None if the changes can not be tracked.
+        """
+        return None
+
+    def read_weights(self, deformer, geometry):
+        """
+        Returns the weight of every point of the geometry.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: (n_points,) float32 array.
+        """
+        return self.read_weight_map(deformer, geometry).to_dense()
+
+    def write_weights(self, deformer, geometry, weights):
+        """
+        Sets the weight of every point of the geometry.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :param weights: (n_points,) array.
+        """
+        self.write_weight_map(deformer, geometry, WeightMap.from_dense(weights))
+
+
+class MayaWeightIO(WeightIO):
+    """
+    Reads and writes weight maps of the Maya scene with bulk getAttr/setAttr calls.
+    Each read is one getAttr of the whole multi attribute and each write is one multi-index setAttr per run of
+    consecutive indices.
+    """
+
+    def __init__(self):
+        assert cmds is not None, "MayaWeightIO needs to be used inside Maya"
+
+    def read_weight_map(self, deformer, geometry):
+        if isinstance(deformer, SkinInfluence):
+            return self.read_influence_weight_map(deformer, geometry)
+
+        plug = self.get_weight_plug(deformer, geometry)
+        assert plug, "The deformer {} does not have the weight list for {}".format(deformer, geometry)
+
+        n_points = self.get_point_count(geometry)
+        indices = cmds.getAttr(plug, multiIndices=True) or list()
+        self.read_calls += 1
+        if not indices:
+            return WeightMap(n_points, default=DEFAULT_WEIGHT)
+
+        indices = np.array(indices, dtype=np.int64)
+        values = np.array(cmds.getAttr(plug), dtype=np.float32).ravel()
+        self.read_calls += 1
+        self.weights_read += len(values)
+        valid = indices < n_points
+        return WeightMap(n_points, indices[valid], values[valid], default=DEFAULT_WEIGHT)
+
+    def write_weight_map(self, deformer, geometry, weight_map):
+        assert not isinstance(deformer, SkinInfluence), "The skinCluster influences can not be written"
+        plug = self.get_weight_plug(deformer, geometry)
+        assert plug, "The deformer {} does not have the weight list for {}".format(deformer, geometry)
+
+        stored = self.read_weight_map(deformer, geometry)
+        indices, values, _ = merge_for_write(stored, weight_map)
+        self.write_plug_values(plug, indices, values, stored.get(indices))
+
+    def write_weight_values(self, deformer, geometry, indices, values):
+        assert not isinstance(deformer, SkinInfluence), "The skinCluster influences can not be written"
+        plug = self.get_weight_plug(deformer, geometry)
+        assert plug, "The deformer {} does not have the weight list for {}".format(deformer, geometry)
+
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        order = np.argsort(indices, kind="stable")
+        indices = indices[order]
+        # Only the old values of the written points are read, to record them for undo.
+        old_values = self.read_plug_values(plug, indices) if self.deltas is not None else None
+        self.write_plug_values(plug, indices, np.asarray(values, dtype=np.float32).ravel()[order], old_values)
+
+    def read_skin_weights(self, skin_cluster, geometry):
+        fn_skin = oma.MFnSkinCluster(get_mobject(skin_cluster))
+        dag_path = get_dag_path(get_shape(geometry))
+        fn_component = om.MFnSingleIndexedComponent()
+        components = fn_component.create(om.MFn.kMeshVertComponent)
+        fn_component.setCompleteData(self.get_point_count(geometry))
+
+        weights, n_influences = fn_skin.getWeights(dag_path, components)
+        self.read_calls += 1
+        self.weights_read += len(weights)
+        influences = [path.partialPathName() for path in fn_skin.influenceObjects()]
+        return np.array(weights, dtype=np.float32).reshape(-1, n_influences), influences
+
+    def has_weights(self, deformer, geometry):
+        if isinstance(deformer, SkinInfluence):
+            if self.get_geometry_index(deformer.skin_cluster, geometry) is None:
+                return False
+            influences = [path.partialPathName()
+                          for path in oma.MFnSkinCluster(get_mobject(deformer.skin_cluster)).influenceObjects()]
+            return deformer.find_column(influences) is not None
+        return bool(self.get_weight_plug(deformer, geometry))
+
+    def get_weights_version(self, deformer, geometry):
+        if isinstance(deformer, SkinInfluence):
+            return self.get_weights_version(deformer.skin_cluster, geometry)
+
+        node = get_mobject(deformer.blend_shape if isinstance(deformer, BlendShapeMap) else deformer)
+        key = om.MObjectHandle(node).hashCode()
+        entry = _weight_versions.get(key)
+        if entry is None or not (entry[0].isValid() and entry[0].isAlive() and entry[0].object() == node):
+            _install_scene_callbacks()
+            _forget_weight_version(key)
+            entry = _weight_versions[key] = [om.MObjectHandle(node),
+                                             om.MNodeMessage.addAttributeChangedCallback(node, _weights_changed, key),
+                                             next(_version_counter)]
+        return key, entry[2], str(self.get_weight_plug(deformer, geometry))
+
+    def read_plug_values(self, plug, indices):
+        """
+        Reads the values of some elements of a weight multi attribute. The elements that are not stored have the
+        default value of the attribute.
+        :param plug: Name of the multi attribute.
+        :param indices: sorted (n,) int array with the element indices.
+        :return: (n,) float32 array.
+        """
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        values = np.full(len(indices), DEFAULT_WEIGHT, dtype=np.float32)
+        stored = np.array(cmds.getAttr(plug, multiIndices=True) or list(), dtype=np.int64)
+        self.read_calls += 1
+        # Only the stored elements are read, with a ranged getAttr for each run of consecutive indices.
+        positions = np.flatnonzero(np.isin(indices, stored))
+        for start, end in index_runs(indices[positions]):
+            first, last = int(indices[positions[start]]), int(indices[positions[end - 1]])
+            values[positions[start:end]] = np.array(cmds.getAttr("{}[{}:{}]".format(plug, first, last)),
+                                                    dtype=np.float32).ravel()
+            self.read_calls += 1
+            self.weights_read += end - start
+        return values
+
+    def write_plug_values(self, plug, indices, values, old_values=None):
+        """
+        Writes the values of the elements of a weight multi attribute with a setAttr call for each run of consecutive
+        indices. Inside undo_step the calls are not recorded in the undo queue, the change is recorded as a
+        WeightDelta instead.
+        :param plug: Name of the multi attribute.
+        :param indices: sorted (n,) int array with the element indices.
+        :param values: (n,) array with the values.
+        :param old_values: (n,) array with the current values. It is needed inside undo_step.
+        """
+        self.weights_written += len(indices)
+        if self.deltas is None:
+            self.write_calls += self.set_plug_values(plug, indices, values)
+            return
+        if not len(indices):
+            return
+
+        delta = WeightDelta(plug, indices, old_values, values)
+        self.write_calls += delta.redo()
+        self.deltas.append(delta)
+
+    @staticmethod
+    def set_plug_values(plug, indices, values):
+        """
+        Sets the values of the elements of a multi attribute with a setAttr call for each run of consecutive indices.
+        :param plug: Name of the multi attribute.
+        :param indices: sorted (n,) int array with the element indices.
+        :param values: (n,) array with the values.
+        :return: Number of setAttr calls.
+        """
+        return set_plug_elements(plug, indices, values, undoable=True)
+
+    @staticmethod
+    def get_point_count(geometry):
+        """
+        Returns the number of points of a geometry.
+        :param geometry: Geometry name or PyNode.
+        :return: int
+        """
+        return om.MItGeometry(get_dag_path(get_shape(geometry))).count()
+
+    @staticmethod
+    def get_geometry_index(deformer, geometry):
+        """
+        Returns the index of the geometry in the deformer, or None if the deformer does not affect the geometry.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: int or None
+        """
+        return cdw_graph.get_index().get_geometry_index(deformer, get_shape(geometry))
+
+    def get_weight_plug(self, deformer, geometry):
+        """
+        Returns the name of the multi attribute with the weights of the deformer for the geometry.
+        :param deformer: Deformer name or PyNode.
+        :param geometry: Geometry name or PyNode.
+        :return: str or None
+        """
+        if isinstance(deformer, BlendShapeMap):
+            index = self.get_geometry_index(deformer.blend_shape, geometry)
+            if index is None:
+                return None
+            if deformer.target is None:
+                return "{}.inputTarget[{}].baseWeights".format(deformer.blend_shape, index)
+            return "{}.inputTarget[{}].inputTargetGroup[{}].targetWeights".format(deformer.blend_shape, index,
+                                                                                  deformer.target)
+
+        index = self.get_geometry_index(deformer, geometry)
+        if index is None:
+            return None
+        if cmds.nodeType(str(deformer)) == "blendShape":
+            return "{}.inputTarget[{}].baseWeights".format(deformer, index)
+        return "{}.weightList[{}].weights".format(deformer, index)
+
+    def list_blend_shape_maps(self, blend_shape):
+        blend_shape = str(blend_shape)
+        aliases = cmds.aliasAttr(blend_shape, q=True) or list()
+        names = dict()
+        for alias, attribute in zip(aliases[::2], aliases[1::2]):
+            if attribute.startswith("weight["):
+                names[int(attribute[len("weight["):-1])] = alias
+
+        maps = [BlendShapeMap(blend_shape)]
+        for target in cmds.getAttr("{}.weight".format(blend_shape), multiIndices=True) or list():
+            maps.append(BlendShapeMap(blend_shape, target, names.get(target)))
+        return maps
+
+
+class MemoryWeightIO(WeightIO):
+    """
+    Keeps weight maps in memory. Used as a stand-in of the Maya scene.
+    It counts the calls and the number of weights moved by them, so the batching of the callers can be measured.
+    """
+
+    def __init__(self):
+        self.weight_maps = dict()
+        self.skin_weights = dict()
+        self.point_counts = dict()
+        self.blend_shape_maps = dict()
+        self.versions = dict()
+        self.read_calls = 0
+        self.write_calls = 0
+        self.weights_read = 0
+        self.weights_written = 0
+
+    def add_geometry(self, geometry, n_points):
+        """
+        Registers a geometry.
+        :param geometry: Geometry name.
+        :param n_points: Number of points of the geometry.
+        """
+        self.point_counts[str(geometry)] = n_points
+
+    def add_deformer(self, deformer, geometry, weights=None):
+        """
+        Registers a weight map of a deformer for a geometry.
+        :param deformer: Deformer name.
+        :param geometry: Geometry name, it must be registered with add_geometry.
+        :param weights: Initial weights, dense array or WeightMap. By default the weight list does not store points
+        and all its weights are DEFAULT_WEIGHT.
+        """
+        n_points = self.point_counts[str(geometry)]
+        if weights is None:
+            weights = WeightMap(n_points, default=DEFAULT_WEIGHT)
+        elif not isinstance(weights, WeightMap) or weights.default != DEFAULT_WEIGHT:
+            # The points that are not stored have the default value of the weight attribute, like in Maya.
+            weights = WeightMap.from_dense(np.asarray(weights.to_dense() if isinstance(weights, WeightMap)
+                                                      else weights), default=DEFAULT_WEIGHT)
+        assert len(weights) == n_points, "The weight map must have {} weights".format(n_points)
+        self.weight_maps[(str(deformer), str(geometry))] = weights.copy()
+
+    def add_skin_cluster(self, skin_cluster, geometry, weights, influences):
+        """
+        Registers the weight matrix of a skinCluster for a geometry.
+        :param skin_cluster: skinCluster name.
+        :param geometry: Geometry name, it must be registered with add_geometry.
+        :param weights: (n_points, n_influences) array.
+        :param influences: list with the influence names, in the order of the columns of weights.
+        """
+        weights = np.array(weights, dtype=np.float32)
+        assert weights.shape == (self.point_counts[str(geometry)], len(influences)), \
+            "The weight matrix must have a row for each point and a column for each influence"
+        self.skin_weights[(str(skin_cluster), str(geometry))] = (weights, [str(name) for name in influences])
+
+    def add_blend_shape(self, blend_shape, geometry, targets=(), weights=None):
+        """
+        Registers the base weights and the target weights of a blendShape for a geometry.
+        :param blend_shape: blendShape name.
+        :param geometry: Geometry name, it must be registered with add_geometry.
+        :param targets: list with the target names. Their indices are their positions in the list.
+        :param weights: dict with the initial weights of some maps, by name. The base weights are named base.
+        """
+        weights = dict() if weights is None else weights
+        maps = [BlendShapeMap(blend_shape)] + [BlendShapeMap(blend_shape, index, name)
+                                               for index, name in enumerate(targets)]
+        for blend_shape_map in maps:
+            self.add_deformer(blend_shape_map, geometry, weights.get(blend_shape_map.name))
+        self.blend_shape_maps[str(blend_shape)] = maps
+
+    def list_blend_shape_maps(self, blend_shape):
+        return list(self.blend_shape_maps[str(blend_shape)])
+
+    def read_skin_weights(self, skin_cluster, geometry):
+        weights, influences = self.skin_weights[(str(skin_cluster), str(geometry))]
+        self.read_calls += 1
+        self.weights_read += weights.size
+        return weights.copy(), list(influences)
+
+    def read_weight_map(self, deformer, geometry):
+        if isinstance(deformer, SkinInfluence):
+            return self.read_influence_weight_map(deformer, geometry)
+
+        weight_map = self.weight_maps[(str(deformer), str(geometry))]
+        self.read_calls += 1
+        self.weights_read += weight_map.nnz
+        return weight_map.copy()
+
+    def write_weight_map(self, deformer, geometry, weight_map):
+        key = (str(deformer), str(geometry))
+        assert len(weight_map) == len(self.weight_maps[key]), "The weight map must have {} weights".format(
+            len(self.weight_maps[key]))
+        indices, _, stored = merge_for_write(self.weight_maps[key], weight_map)
+        self.weight_maps[key] = stored
+        self.versions[key] = self.versions.get(key, 0) + 1
+        self.write_calls += 1
+        self.weights_written += len(indices)
+
+    def has_weights(self, deformer, geometry):
+        if isinstance(deformer, SkinInfluence):
+            key = (deformer.skin_cluster, str(geometry))
+            return key in self.skin_weights and deformer.find_column(self.skin_weights[key][1]) is not None
+        return (str(deformer), str(geometry)) in self.weight_maps
+
+    def get_weights_version(self, deformer, geometry):
+        if isinstance(deformer, SkinInfluence):
+            deformer = deformer.skin_cluster
+        return self.versions.get((str(deformer), str(geometry)), 0)
+
+
+def _weights_changed(message, plug, other_plug, key):
+    """
+    Attribute changed callback of the deformers. Changes the version of the weights of the deformer when any of
+    its weight attributes is set or an element is added or removed.
+    """
+    if not message & (om.MNodeMessage.kAttributeSet | om.MNodeMessage.kAttributeArrayAdded |
+                      om.MNodeMessage.kAttributeArrayRemoved):
+        return
+    if om.MFnAttribute(plug.attribute()).name in WEIGHT_ATTRIBUTES and key in _weight_versions:
+        _weight_versions[key][2] = next(_version_counter)
+
+
+def _forget_weight_version(key):
+    """
+    Drops the version of a node and removes its callback.
+    :param key: MObjectHandle hash code of the node.
+    """
+    entry = _weight_versions.pop(key, None)
+    if entry is None:
+        return
+    try:
+        om.MMessage.removeCallback(entry[1])
+    except RuntimeError:
+        # The callbacks of a deleted node can be already removed.
+        pass
+
+
+def _node_removed(node, client_data):
+    _forget_weight_version(om.MObjectHandle(node).hashCode())
+
+
+def _scene_changed(client_data):
+    for key in list(_weight_versions):
+        _forget_weight_version(key)
+
+
+def _install_scene_callbacks():
+    """
+    Adds, once, the Maya callbacks that drop the versions of the removed nodes and of the closed scenes.
+    """
+    if not _scene_callbacks:
+        _scene_callbacks.extend([om.MDGMessage.addNodeRemovedCallback(_node_removed, "dependNode"),
+                                 om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, _scene_changed),
+                                 om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, _scene_changed),
+                                 ])
+
+
+def get_shape(geometry):
+    """
+    Returns the first non-intermediate shape of a geometry, or the geometry itself if it is a shape.
+    :param geometry: Transform or shape name or PyNode.
+    :return: str
+    """
+    geometry = str(geometry)
+    if cmds.objectType(geometry, isAType="shape"):
+        return geometry
+    shapes = cmds.listRelatives(geometry, shapes=True, noIntermediate=True, fullPath=True) or list()
+    assert shapes, "{} does not have shapes".format(geometry)
+    return shapes[0]
+
+
+def get_mobject(node):
+    """
+    Returns the OpenMaya MObject of a node.
+    :param node: PyNode or name of a node.
+    :return: om.MObject
+    """
+    selection = om.MSelectionList()
+    selection.add(str(node))
+    return selection.getDependNode(0)
+
+
+def get_dag_path(node):
+    """
+    Returns the OpenMaya MDagPath of a node.
+    :param node: PyNode or name of a dag node.
+    :return: om.MDagPath
+    """
+    selection = om.MSelectionList()
+    selection.add(str(node))
+    return selection.getDagPath(0)
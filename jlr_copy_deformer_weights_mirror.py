@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_mirror.py - Python Script
+##################################################################################
+# Description:
+# Mirror and flip of weight maps.
+#
+# The symmetry of a geometry is stored as a Correspondence that maps every point to its mirrored point. The points
+# with a mirrored vertex closer than the tolerance use that vertex, the rest of the points interpolate the closest
+# point of the surface, so geometries without a perfect symmetric topology can be mirrored too.
+# Once the correspondence is computed, mirroring or flipping a weight map is a single gather.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import numpy as np
+
+import jlr_copy_deformer_weights_engine as engine
+
+AXES = {"x": 0, "y": 1, "z": 2}
+
+
+def get_axis_index(axis):
+    """
+    Returns the index of an axis.
+    :param axis: x, y, z or 0, 1, 2.
+    :return: int
+    """
+    axis = AXES.get(axis, axis)
+    assert axis in (0, 1, 2), "The axis must be x, y or z"
+    return axis
+
+
+def mirror_correspondence(points, triangles, axis="x", tolerance=0.001):
+    """
+    Computes the correspondence between the points of a geometry and their mirrored position.
+    :param points: (n, 3) array with the positions of the points.
+    :param triangles: (m, 3) array with the vertex indices of the triangles of the geometry.
+    :param axis: Mirror axis, the positions are mirrored negating this coordinate.
+    :param tolerance: Maximum distance between a mirrored position and a vertex to use that vertex.
+    :return: Correspondence
+    """
+    points = np.asarray(points, dtype=np.float64)
+    mirrored = points.copy()
+    mirrored[:, get_axis_index(axis)] *= -1.0
+
+    def distance2(query_ids, point_ids):
+        delta = mirrored[query_ids] - points[point_ids]
+        return np.einsum("ij,ij->i", delta, delta)
+
+    vertex_ids, distances = engine.BVH(points, points).nearest(mirrored, distance2)
+    indices = np.repeat(vertex_ids[:, None], 3, axis=1)
+    weights = np.zeros((len(points), 3), dtype=np.float32)
+    weights[:, 0] = 1.0
+
+    asymmetric = np.flatnonzero(distances > tolerance ** 2)
+    if len(asymmetric) and len(triangles):
+        surface = engine.SourceSurface(points, triangles)
+        triangle_ids, bary = surface.closest_points(mirrored[asymmetric])
+        indices[asymmetric] = surface.triangles[triangle_ids]
+        weights[asymmetric] = bary
+
+    return engine.Correspondence(indices, weights)
+
+
+def get_receiving_points(points, axis="x", direction=1):
+    """
+    Returns the points that receive the weights in a mirror.
+    :param points: (n, 3) array with the positions of the points.
+    :param axis: Mirror axis.
+    :param direction: 1 copies the positive side into the negative side, -1 the negative side into the positive side.
+    :return: (n,) bool array.
+    """
+    assert direction in (1, -1), "The direction must be 1 or -1"
+    return np.asarray(points)[:, get_axis_index(axis)] * direction < 0
+
+
+def mirror_weights(weights, correspondence, receiving):
+    """
+    Mirrors a weight map.
+    :param weights: (n,) array with the weight map.
+    :param correspondence: Correspondence returned by mirror_correspondence.
+    :param receiving: (n,) bool array with the points that receive the mirrored weights.
+    :return: (n,) float32 array.
+    """
+    weights = np.asarray(weights, dtype=np.float32)
+    return np.where(receiving, correspondence.apply(weights), weights)
+
+
+def flip_weights(weights, correspondence):
+    """
+    Flips a weight map, every point gets the weight of its mirrored point.
+    :param weights: (n,) array with the weight map.
+    :param correspondence: Correspondence returned by mirror_correspondence.
+    :return: (n,) float32 array.
+    """
+    return correspondence.apply(np.asarray(weights, dtype=np.float32))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_ops.py - Python Script
+##################################################################################
+# Description:
+# Operations on weight maps: Laplacian smoothing, combination of maps (add, subtract, multiply, min, max and
+# blend), clamp, normalize and remap with a curve.
+#
+# The operations work on dense weight arrays of any number of maps at the same time, (..., n_points), and they are
+# vectorized. The smoothing uses the vertex adjacency of the geometry in CSR form, which only depends on the
+# topology, so it can be built once and cached.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import numpy as np
+
+OPERATIONS = {"add": np.add,
+              "subtract": np.subtract,
+              "multiply": np.multiply,
+              "min": np.minimum,
+              "max": np.maximum,
+              "blend": lambda weights, other: np.broadcast_to(other, np.broadcast(weights, other).shape),
+              }
+
+INTERPOLATIONS = ("linear", "smooth")
+
+
+class VertexAdjacency(object):
+    """
+    Neighbor vertices of each vertex of a geometry, in CSR form. The neighbors of the vertex i are
+    neighbors[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, n_points, edges):
+        """
+        :param n_points: Number of points of the geometry.
+        :param edges: (m, 2) int array with the vertex indices of the edges. The direction and the repeated edges do
+        not matter.
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        self.n_points = int(n_points)
+        # Each directed edge is encoded as a single integer, sorting them sorts the edges by vertex and neighbor.
+        codes = np.sort(np.concatenate([edges[:, 0] * self.n_points + edges[:, 1],
+                                        edges[:, 1] * self.n_points + edges[:, 0]]))
+        codes = codes[np.concatenate([[True], codes[1:] != codes[:-1]])] if len(codes) else codes
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes // self.n_points,
+                                                                  minlength=self.n_points))])
+        self.neighbors = (codes % self.n_points).astype(np.int32)
+
+    def __len__(self):
+        return self.n_points
+
+    @classmethod
+    def from_polygons(cls, n_points, face_counts, face_vertices):
+        """
+        Creates the adjacency of a polygon mesh from its edges.
+        :param n_points: Number of points of the mesh.
+        :param face_counts: (n_faces,) int array with the number of vertices of each face.
+        :param face_vertices: int array with the vertices of all the faces.
+        :return: VertexAdjacency
+        """
+        face_counts = np.asarray(face_counts, dtype=np.int64)
+        face_vertices = np.asarray(face_vertices, dtype=np.int64)
+        # Each face vertex is joined to the next one, and the last vertex of each face to the first one.
+        following = np.arange(1, len(face_vertices) + 1)
+        ends = np.cumsum(face_counts)
+        following[ends[face_counts > 0] - 1] = (ends - face_counts)[face_counts > 0]
+        return cls(n_points, np.stack([face_vertices, face_vertices[following]], axis=1))
+
+    @classmethod
+    def from_triangles(cls, n_points, triangles):
+        """
+        Creates the adjacency of a triangle mesh.
+        :param n_points: Number of points of the mesh.
+        :param triangles: (n, 3) int array.
+        :return: VertexAdjacency
+        """
+        triangles = np.asarray(triangles, dtype=np.int64)
+        return cls.from_polygons(n_points, np.full(len(triangles), 3), triangles.ravel())
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the stored arrays.
+        """
+        return self.offsets.nbytes + self.neighbors.nbytes
+
+    @property
+    def degrees(self):
+        """
+        Number of neighbors of each vertex.
+        """
+        return np.diff(self.offsets)
+
+    def neighbor_mean(self, weights):
+        """
+        Returns the mean of the weights of the neighbors of each vertex. The vertices without neighbors keep their
+        weight.
+        :param weights: (..., n_points) array.
+        :return: (..., n_points) float32 array.
+        """
+        weights = np.asarray(weights, dtype=np.float32)
+        degrees = self.degrees
+        connected = degrees > 0
+        if not connected.any():
+            return weights.copy()
+        # A zero is appended so every offset is a valid index of reduceat, the sums of the vertices without
+        # neighbors are not used.
+        values = weights[..., self.neighbors]
+        values = np.concatenate([values, np.zeros(values.shape[:-1] + (1,), dtype=np.float32)], axis=-1)
+        sums = np.add.reduceat(values, self.offsets[:-1], axis=-1)
+        return np.where(connected, sums / np.maximum(degrees, 1), weights).astype(np.float32)
+
+
+def smooth(weights, adjacency, iterations=1, strength=0.5, points=None):
+    """
+    Smooths weights moving each weight to the mean of its neighbors.
+    :param weights: (..., n_points) array.
+    :param adjacency: VertexAdjacency of the geometry.
+    :param iterations: Number of smoothing steps.
+    :param strength: Fraction of the way to the mean of the neighbors moved on each step, from 0 to 1.
+    :param points: int array with the point indices that are smoothed, the rest of the points do not change but
+    they still affect their neighbors. By default all the points.
+    :return: (..., n_points) float32 array.
+    """
+    weights = np.array(weights, dtype=np.float32)
+    mask = None
+    if points is not None:
+        mask = np.zeros(len(adjacency), dtype=bool)
+        mask[np.asarray(points, dtype=np.int64)] = True
+
+    for _ in range(iterations):
+        smoothed = weights + (adjacency.neighbor_mean(weights) - weights) * np.float32(strength)
+        weights = smoothed if mask is None else np.where(mask, smoothed, weights)
+    return weights
+
+
+def combine(weights, other, operation="add", factor=1.0):
+    """
+    Combines weights with other weights, for example to multiply weight maps by a mask.
+    :param weights: (..., n_points) array.
+    :param other: (n_points,) or (..., n_points) array, or a number.
+    :param operation: add, subtract, multiply, min, max or blend. blend replaces the weights with the other weights.
+    :param factor: Amount of the result of the operation, from 0 (the weights do not change) to 1.
+    :return: (..., n_points) float32 array.
+    """
+    assert operation in OPERATIONS, "operation must be one of {}".format(", ".join(sorted(OPERATIONS)))
+    weights = np.asarray(weights, dtype=np.float32)
+    result = OPERATIONS[operation](weights, np.asarray(other, dtype=np.float32))
+    if factor != 1.0:
+        result = weights + (result - weights) * np.float32(factor)
+    return np.array(result, dtype=np.float32)
+
+
+def clamp(weights, minimum=0.0, maximum=1.0):
+    """
+    Limits the weights to a range.
+    :param weights: (..., n_points) array.
+    :param minimum: Minimum weight.
+    :param maximum: Maximum weight.
+    :return: (..., n_points) float32 array.
+    """
+    return np.clip(np.asarray(weights, dtype=np.float32), minimum, maximum)
+
+
+def normalize(weights, minimum=0.0, maximum=1.0):
+    """
+    Rescales the weights of each map so its lowest weight is minimum and its highest weight is maximum. A map with
+    the same weight in every point does not change.
+    :param weights: (..., n_points) array.
+    :param minimum: New lowest weight.
+    :param maximum: New highest weight.
+    :return: (..., n_points) float32 array.
+    """
+    weights = np.asarray(weights, dtype=np.float32)
+    if not weights.size:
+        return weights.copy()
+    lowest = weights.min(axis=-1, keepdims=True)
+    ranges = weights.max(axis=-1, keepdims=True) - lowest
+    scaled = minimum + (weights - lowest) / np.where(ranges > 0, ranges, 1.0) * (maximum - minimum)
+    return np.where(ranges > 0, scaled, weights).astype(np.float32)
+
+
+def remap(weights, curve, interpolation="linear"):
+    """
+    Remaps the weights with a curve, for example to change the falloff of a map.
+    :param weights: (..., n_points) array.
+    :param curve: list of (input, output) keys sorted by input. The weights outside the keys get the output of the
+    first or the last key.
+    :param interpolation: linear, or smooth for an ease in and out between the keys.
+    :return: (..., n_points) float32 array.
+    """
+    assert interpolation in INTERPOLATIONS, "interpolation must be one of {}".format(", ".join(INTERPOLATIONS))
+    keys = np.asarray(curve, dtype=np.float64).reshape(-1, 2)
+    assert len(keys), "The curve must have at least one key"
+    assert np.all(np.diff(keys[:, 0]) > 0), "The keys of the curve must be sorted by input"
+    weights = np.asarray(weights, dtype=np.float32)
+    if len(keys) == 1:
+        return np.full(weights.shape, keys[0, 1], dtype=np.float32)
+
+    position = np.interp(weights, keys[:, 0], np.arange(len(keys)))
+    segment = np.minimum(position.astype(np.int64), len(keys) - 2)
+    t = position - segment
+    if interpolation == "smooth":
+        t = t * t * (3.0 - 2.0 * t)
+    return (keys[segment, 1] + (keys[segment + 1, 1] - keys[segment, 1]) * t).astype(np.float32)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_profile.py - Python Script
+##################################################################################
+# Description:
+# Instrumentation of the transfers. A TransferStats collects the time of each phase of a transfer, counters like
+# the number of weights read and written, the calls to the scene and the hits of the source cache, and optionally
+# a cProfile report of each phase.
+#
+# The stats of a transfer can be logged as a JSON line into the file of the CDW_PROFILE_LOG environment variable,
+# so the performance of the transfers can be compared between versions, and the stats of several transfers can be
+# aggregated.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+LOG_PATH = os.environ.get("CDW_PROFILE_LOG")
+
+# Counters of the WeightIOs and of the SourceCaches measured by TransferStats.measure.
+IO_COUNTERS = ("read_calls", "write_calls", "weights_read", "weights_written")
+CACHE_COUNTERS = ("hits", "misses", "evictions")
+
+
+class TransferStats(object):
+    """
+    Times, counters and profiles of a transfer.
+    """
+
+    def __init__(self, name, profile=False, log_path=None):
+        """
+        :param name: Name of the transfer.
+        :param profile: Captures a cProfile report of each phase.
+        :param log_path: JSON lines file where finish writes the stats. By default LOG_PATH.
+        """
+        self.name = name
+        self.profile = profile
+        self.log_path = LOG_PATH if log_path is None else log_path
+        self.runs = 1
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self.profiles = OrderedDict()
+        self.info = dict()
+        self.seconds = 0.0
+        self._start = default_timer()
+
+    def __repr__(self):
+        return "TransferStats({!r}, {:.3f}s)".format(self.name, self.seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measures the time of a phase. A phase measured several times accumulates its time.
+        :param name: Name of the phase.
+        """
+        profiler = cProfile.Profile() if self.profile else None
+        start = default_timer()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                self.profiles[name] = self.profiles.get(name, "") + format_profile(profiler)
+            self.phases[name] = self.phases.get(name, 0.0) + default_timer() - start
+
+    def count(self, name, value=1):
+        """
+        Adds a value to a counter.
+        :param name: Name of the counter.
+        :param value: Value to add.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def measure(self, weight_io=None, cache=None):
+        """
+        Adds to the counters the calls and the weights moved by a WeightIO and the requests to a SourceCache while
+        the block runs.
+        :param weight_io: WeightIO
+        :param cache: SourceCache
+        """
+        before = get_counters(weight_io, cache)
+        try:
+            yield
+        finally:
+            for name, value in get_counters(weight_io, cache).items():
+                self.count(name, value - before[name])
+
+    def finish(self):
+        """
+        Stores the total time of the transfer and writes the stats into the log file, if there is one.
+        :return: TransferStats
+        """
+        self.seconds = default_timer() - self._start
+        if self.log_path:
+            self.log(self.log_path)
+        return self
+
+    def log(self, path):
+        """
+        Appends the stats as a JSON line to a file.
+        :param path: File path.
+        """
+        record = self.to_dict()
+        record["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(path, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def to_dict(self):
+        """
+        :return: dict that can be stored as JSON.
+        """
+        return {"name": self.name,
+                "runs": self.runs,
+                "seconds": self.seconds,
+                "phases": dict(self.phases),
+                "counters": dict(self.counters),
+                "profiles": dict(self.profiles),
+                "info": dict(self.info),
+                }
+
+    @classmethod
+    def aggregate(cls, stats, name="aggregate"):
+        """
+        Sums the times and the counters of several stats.
+        :param stats: list of TransferStats.
+        :param name: Name of the result.
+        :return: TransferStats
+        """
+        result = cls(name, log_path="")
+        result.runs = 0
+        for each_stats in stats:
+            result.runs += each_stats.runs
+            result.seconds += each_stats.seconds
+            for phase, seconds in each_stats.phases.items():
+                result.phases[phase] = result.phases.get(phase, 0.0) + seconds
+            for counter, value in each_stats.counters.items():
+                result.count(counter, value)
+        return result
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates stats from the result of to_dict.
+        :param data: dict
+        :return: TransferStats
+        """
+        result = cls(data["name"], log_path="")
+        result.runs = data.get("runs", 1)
+        result.seconds = data.get("seconds", 0.0)
+        result.phases.update(data.get("phases", dict()))
+        result.counters.update(data.get("counters", dict()))
+        result.profiles.update(data.get("profiles", dict()))
+        result.info.update(data.get("info", dict()))
+        return result
+
+
+def get_counters(weight_io=None, cache=None):
+    """
+    Returns the current counters of a WeightIO and of a SourceCache.
+    :param weight_io: WeightIO or None.
+    :param cache: SourceCache or None.
+    :return: dict
+    """
+    counters = OrderedDict()
+    for name in IO_COUNTERS:
+        counters[name] = getattr(weight_io, name, 0) if weight_io is not None else 0
+    for name in CACHE_COUNTERS:
+        counters["cache_" + name] = getattr(cache, name, 0) if cache is not None else 0
+    return counters
+
+
+def format_profile(profiler, limit=20):
+    """
+    Returns the functions of a cProfile report with the highest cumulative time.
+    :param profiler: cProfile.Profile
+    :param limit: Number of functions.
+    :return: str
+    """
+    stream = io.StringIO() if str is not bytes else io.BytesIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_undo.py - Python Script
+##################################################################################
+# Description:
+# Undo of the weight writes. While a transfer runs inside undo_step the weights are written with ranged setAttr
+# calls that are not recorded in the undo queue, and the changes are recorded as deltas: the changed indices with
+# their old and new values in packed arrays. When the transfer ends all the deltas are registered with a single
+# jlrSetDeformerWeights command, so the whole transfer is one undo step, and undo and redo write each map with one
+# setAttr per run of consecutive indices.
+#
+# This file is also the Maya plugin of the command, it is loaded by load_plugin.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import os
+import sys
+from contextlib import contextmanager
+
+import numpy as np
+
+from jlr_copy_deformer_weights_weightmap import index_runs
+
+try:
+    from maya import cmds
+    from maya.api import OpenMaya as om
+except ImportError:
+    cmds = om = None
+
+COMMAND_NAME = "jlrSetDeformerWeights"
+
+# Deltas waiting to be taken by the next command, see execute.
+_pending = list()
+
+
+def maya_useNewAPI():
+    pass
+
+
+class WeightDelta(object):
+    """
+    Change of the values of some elements of a weight multi attribute.
+    """
+
+    def __init__(self, plug, indices, old_values, new_values):
+        """
+        :param plug: Name of the multi attribute.
+        :param indices: sorted (n,) int array with the changed element indices.
+        :param old_values: (n,) array with the values before the change.
+        :param new_values: (n,) array with the values after the change.
+        """
+        self.plug = str(plug)
+        self.indices = np.asarray(indices, dtype=np.int32).ravel()
+        self.old_values = np.asarray(old_values, dtype=np.float32).ravel()
+        self.new_values = np.asarray(new_values, dtype=np.float32).ravel()
+        assert len(self.indices) == len(self.old_values) == len(self.new_values), \
+            "indices, old_values and new_values must have the same length"
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the stored arrays.
+        """
+        return self.indices.nbytes + self.old_values.nbytes + self.new_values.nbytes
+
+    def undo(self):
+        """
+        Writes the old values.
+        :return: Number of setAttr calls.
+        """
+        return set_plug_elements(self.plug, self.indices, self.old_values)
+
+    def redo(self):
+        """
+        Writes the new values.
+        :return: Number of setAttr calls.
+        """
+        return set_plug_elements(self.plug, self.indices, self.new_values)
+
+
+class SetDeformerWeightsCommand(om.MPxCommand if om else object):
+    """
+    Undoable command that applies the pending WeightDeltas.
+    """
+
+    def __init__(self):
+        om.MPxCommand.__init__(self)
+        self.deltas = list()
+
+    @staticmethod
+    def creator():
+        return SetDeformerWeightsCommand()
+
+    def isUndoable(self):
+        return True
+
+    def doIt(self, args):
+        assert _pending, "{} must be executed with execute".format(COMMAND_NAME)
+        self.deltas, applied = _pending.pop()
+        if not applied:
+            self.redoIt()
+
+    def redoIt(self):
+        for delta in self.deltas:
+            delta.redo()
+
+    def undoIt(self):
+        for delta in reversed(self.deltas):
+            delta.undo()
+
+
+def initializePlugin(plugin):
+    om.MFnPlugin(plugin, "Juan Lara", "1.0").registerCommand(COMMAND_NAME, SetDeformerWeightsCommand.creator)
+
+
+def uninitializePlugin(plugin):
+    om.MFnPlugin(plugin).deregisterCommand(COMMAND_NAME)
+
+
+def load_plugin():
+    """
+    Loads this file as a Maya plugin if the command is not registered yet.
+    """
+    if not hasattr(cmds, COMMAND_NAME):
+        cmds.loadPlugin(os.path.splitext(os.path.abspath(__file__))[0] + ".py", quiet=True)
+
+
+def execute(deltas, applied=False):
+    """
+    Registers some deltas with a jlrSetDeformerWeights command, as one undo step.
+    :param deltas: list of WeightDelta.
+    :param applied: True if the new values are already written, the command only stores the deltas for the undo.
+    """
+    load_plugin()
+    # Maya can load the plugin as a new instance of this module, so the deltas are given to the module that
+    # registered the command.
+    sys.modules[__name__]._pending.append((list(deltas), applied))
+    getattr(cmds, COMMAND_NAME)()
+
+
+@contextmanager
+def undo_step(weight_io):
+    """
+    Records the writes of a WeightIO and registers them as a single undo step when the block ends, even if it fails
+    after writing some maps. Nested blocks are recorded by the outer block.
+    :param weight_io: WeightIO. Only the writes of MayaWeightIO are recorded, the rest are not undoable.
+    """
+    if weight_io.deltas is not None:
+        yield weight_io.deltas
+        return
+
+    deltas = weight_io.deltas = list()
+    try:
+        yield deltas
+    finally:
+        weight_io.deltas = None
+        if deltas:
+            execute(deltas, applied=True)
+
+
+def set_plug_elements(plug, indices, values, undoable=False):
+    """
+    Sets the values of the elements of a float multi attribute with a setAttr call for each run of consecutive
+    indices.
+    :param plug: Name of the multi attribute.
+    :param indices: sorted (n,) int array with the element indices.
+    :param values: (n,) array with the values.
+    :param undoable: Records the setAttr calls in the undo queue. By default they are not recorded, the changes are
+    undone with the WeightDeltas.
+    :return: Number of setAttr calls.
+    """
+    indices = np.asarray(indices, dtype=np.int64).ravel()
+    values = np.asarray(values, dtype=np.float64).ravel().tolist()
+    runs = index_runs(indices)
+    suspend = not undoable and cmds.undoInfo(q=True, state=True)
+    if suspend:
+        cmds.undoInfo(stateWithoutFlush=False)
+    try:
+        for start, end in runs:
+            first, last = int(indices[start]), int(indices[end - 1])
+            cmds.setAttr("{}[{}:{}]".format(plug, first, last), *values[start:end], size=end - start)
+    finally:
+        if suspend:
+            cmds.undoInfo(stateWithoutFlush=True)
+    return len(runs)
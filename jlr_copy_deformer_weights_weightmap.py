@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##################################################################################
+# jlr_copy_deformer_weights_weightmap.py - Python Script
+##################################################################################
+# Description:
+# Sparse weight map. Deformer weight lists only store some of the points of a geometry, so a weight map is kept
+# as a sorted array of point indices, an array with their values and a default value for the rest of the points.
+#
+# Author: Juan Lara.
+##################################################################################
+
+import numpy as np
+
+
+class WeightMap(object):
+    """
+    Sparse weight map of a geometry.
+    The indices are sorted and unique. The points that are not in indices have the default value.
+    """
+
+    def __init__(self, size, indices=None, values=None, default=0.0):
+        """
+        :param size: Number of points of the geometry.
+        :param indices: (n,) int array with the stored point indices.
+        :param values: (n,) float array with the values of the stored points.
+        :param default: Value of the points that are not stored.
+        """
+        indices = np.zeros(0, dtype=np.int32) if indices is None else np.asarray(indices, dtype=np.int32).ravel()
+        values = np.zeros(0, dtype=np.float32) if values is None else np.asarray(values, dtype=np.float32).ravel()
+        assert len(indices) == len(values), "indices and values must have the same length"
+
+        if len(indices) and np.any(indices[1:] <= indices[:-1]):
+            indices, first = np.unique(indices[::-1], return_index=True)
+            values = values[::-1][first]
+        assert not len(indices) or (indices[0] >= 0 and indices[-1] < size), "The indices are out of range"
+
+        self.size = int(size)
+        self.indices = indices
+        self.values = values
+        self.default = float(default)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "WeightMap(size={}, nnz={}, default={})".format(self.size, self.nnz, self.default)
+
+    @property
+    def nnz(self):
+        """
+        Number of stored points.
+        """
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the stored arrays.
+        """
+        return self.indices.nbytes + self.values.nbytes
+
+    @classmethod
+    def from_dense(cls, weights, default=0.0, tolerance=0.0):
+        """
+        Creates a weight map storing only the points whose value is not the default value.
+        :param weights: (n,) array with the value of every point.
+        :param default: Default value of the weight map.
+        :param tolerance: Values closer than tolerance to the default value are not stored.
+        :return: WeightMap
+        """
+        weights = np.asarray(weights, dtype=np.float32).ravel()
+        indices = np.flatnonzero(np.abs(weights - default) > tolerance)
+        return cls(len(weights), indices, weights[indices], default=default)
+
+    def to_dense(self):
+        """
+        Returns the value of every point.
+        :return: (size,) float32 array.
+        """
+        weights = np.full(self.size, self.default, dtype=np.float32)
+        weights[self.indices] = self.values
+        return weights
+
+    def get(self, indices):
+        """
+        Returns the values of some points.
+        :param indices: int array with point indices.
+        :return: float32 array with the same shape as indices.
+        """
+        indices = np.asarray(indices)
+        result = np.full(indices.shape, self.default, dtype=np.float32)
+        if not self.nnz:
+            return result
+        position = np.minimum(np.searchsorted(self.indices, indices), self.nnz - 1)
+        found = self.indices[position] == indices
+        result[found] = self.values[position[found]]
+        return result
+
+    def missing_indices(self):
+        """
+        Returns the indices of the points that are not stored.
+        :return: (size - nnz,) int32 array.
+        """
+        return np.setdiff1d(np.arange(self.size, dtype=np.int32), self.indices, assume_unique=True)
+
+    def fill_missing(self, value=None):
+        """
+        Returns a weight map that stores every point, the missing points get the value.
+        :param value: Value of the missing points. By default the default value.
+        :return: WeightMap
+        """
+        value = self.default if value is None else value
+        missing = self.missing_indices()
+        return self.update(missing, np.full(len(missing), value, dtype=np.float32))
+
+    def sparsify(self, tolerance=0.0):
+        """
+        Returns a weight map without the stored points whose value is the default value.
+        :param tolerance: Values closer than tolerance to the default value are removed.
+        :return: WeightMap
+        """
+        keep = np.abs(self.values - self.default) > tolerance
+        return WeightMap(self.size, self.indices[keep], self.values[keep], default=self.default)
+
+    def update(self, indices, values):
+        """
+        Returns a weight map with the values of some points replaced or added.
+        :param indices: (n,) int array with point indices.
+        :param values: (n,) array with the new values.
+        :return: WeightMap
+        """
+        indices = np.asarray(indices, dtype=np.int32).ravel()
+        keep = ~np.isin(self.indices, indices, assume_unique=True)
+        return WeightMap(self.size,
+                         np.concatenate([self.indices[keep], indices]),
+                         np.concatenate([self.values[keep], np.asarray(values, dtype=np.float32).ravel()]),
+                         default=self.default)
+
+    def copy(self):
+        """
+        :return: WeightMap
+        """
+        return WeightMap(self.size, self.indices.copy(), self.values.copy(), default=self.default)
+
+
+def merge_for_write(stored, weight_map):
+    """
+    Returns the point indices and values that must be written over a stored weight map to get weight_map.
+    Only the points whose value changes are written. The points that are not stored keep the default value of the
+    stored map, so when the default values of both maps differ every point is compared.
+    :param stored: WeightMap currently stored.
+    :param weight_map: WeightMap that is going to be stored.
+    :return: tuple with an (n,) int32 array of indices, an (n,) float32 array of values and the stored WeightMap.
+    """
+    if stored.default != weight_map.default:
+        values = weight_map.to_dense()
+        indices = np.flatnonzero(stored.to_dense() != values).astype(np.int32)
+        return indices, values[indices], stored.update(indices, values[indices])
+
+    indices = np.union1d(stored.indices, weight_map.indices).astype(np.int32)
+    values = weight_map.get(indices)
+    changed = stored.get(indices) != values
+    return indices[changed], values[changed], stored.update(indices[changed], values[changed])
+
+
+def index_runs(indices):
+    """
+    Splits a sorted list of indices in runs of consecutive indices.
+    :param indices: sorted (n,) int array.
+    :return: list of tuples (start, end) with the positions of each run in the indices array, end excluded.
+    """
+    indices = np.asarray(indices)
+    if not len(indices):
+        return list()
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(indices)]])
+    return list(zip(starts.tolist(), ends.tolist()))